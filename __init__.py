@@ -117,7 +117,7 @@ else:
     from . import www
 
 
-import os, sys, glob, string, gettext, re
+import os, sys, glob, string, gettext, re, time
 import bmesh, addon_utils
 from bpy.types import Menu, Operator, PropertyGroup, Operator, AddonPreferences
 from bpy.props import *
@@ -736,6 +736,15 @@ class Avastar(AddonPreferences):
             col.prop(self, "rig_cache_data")
             col.prop(self, "fix_data_on_upload")
 
+            if HANDLER_STATS:
+                col = box.column(align=True)
+                col.label(text="Update handler timings (calls, total ms)")
+                for name, (calls, seconds) in sorted(HANDLER_STATS.items()):
+                    row = col.row(align=True)
+                    row.label(text=name)
+                    row.label(text="%d" % calls)
+                    row.label(text="%.1f" % (1000*seconds))
+
 
         def draw_character_section(box):
             self.draw_create_panel(context, box)
@@ -4138,9 +4147,9 @@ def check_for_armatures_on_update(scene):
             entry = prop.sources.add()
         entry.name = obj.name
 
-    if len(prop.sources) == 1 and (prop.source == None or prop.source == ""):
+    if len(prop.sources) == 1 and (prop.source == None or prop.source not in prop.sources):
         prop.source = prop.sources[0].name
-    if len(prop.targets) == 1 and (prop.target == None or prop.target == ""):
+    if len(prop.targets) == 1 and (prop.target == None or prop.target not in prop.targets):
         prop.target = prop.targets[0].name
 
 class PanelRetargetInfo(bpy.types.Panel):
@@ -5163,18 +5172,117 @@ def register():
     if has_warnings:
         log.warning(SEPARATOR)
 
+DEPSGRAPH_SUBSCRIBERS = [
+    (rig.sync_timeline_action,               {'ARMATURE'}),
+    (rig.check_dirty_armature_on_update,     {'ARMATURE'}),
+    (shape.check_dirty_mesh_on_update,       {'MESH'}),
+    (fix_bone_layers_on_update,              {'ARMATURE', 'MESH'}),
+    (check_for_armatures_on_update,          {'OBJECTS', 'ACTIVE', 'ARMATURES'}),
+    (check_for_system_mesh_edit,             {'MESH'}),
+    (weights.edit_object_change_handler,     {'MESH', 'ACTIVE'}),
+    (rig.fix_linebones_on_update,            {'ARMATURE'}),
+]
+
+HANDLER_STATS = {}
+last_depsgraph_state = None
+last_armature_names = None
+
+def get_depsgraph_changes(scene, depsgraph):
+    '''
+    Return the set of change kinds the subscribers care about:
+    ACTIVE   : the active object or its mode has changed
+    ARMATURE : the active armature (or its data or an action) was updated
+    MESH     : the active mesh (or its data) was updated
+    OBJECTS  : objects were added or removed
+    ARMATURES: armature objects were renamed or tagged
+    '''
+
+    global last_depsgraph_state, last_armature_names
+
+    active = util.get_active_object(bpy.context)
+    object_count = len(bpy.data.objects)
+    state = (active.name if active else None, active.mode if active else None, object_count)
+    changes = set()
+
+    if state != last_depsgraph_state:
+        if not last_depsgraph_state or last_depsgraph_state[2] != object_count:
+            changes.add('OBJECTS')
+        if not last_depsgraph_state or last_depsgraph_state[0:2] != state[0:2]:
+            changes.add('ACTIVE')
+        last_depsgraph_state = state
+
+    if depsgraph is None or any(isinstance(update.id, bpy.types.Object) for update in depsgraph.updates):
+        names = tuple((obj.name, 'avastar' in obj) for obj in bpy.data.objects if obj.type == 'ARMATURE')
+        if names != last_armature_names:
+            changes.add('ARMATURES')
+            last_armature_names = names
+
+    if not active:
+        return changes
+
+    if 'ACTIVE' in changes or depsgraph is None:
+        is_updated = True
+    else:
+        is_updated = False
+        for update in depsgraph.updates:
+            uid = update.id.original
+            if uid == active or uid == active.data or isinstance(uid, bpy.types.Action):
+                is_updated = True
+                break
+
+    if is_updated:
+        if active.type == 'ARMATURE':
+            changes.add('ARMATURE')
+        elif active.type == 'MESH':
+            changes.add('MESH')
+
+    return changes
+
+@persistent
+def dispatch_depsgraph_update(scene, depsgraph=None):
+    '''
+    The only depsgraph_update_post handler of Avastar.
+    Calls the subscribers which are affected by the update
+    and records the time spent in each of them.
+    '''
+
+    if depsgraph is None:
+        util.clear_mesh_cache(None)
+    else:
+        for update in depsgraph.updates:
+            if update.is_updated_geometry:
+                util.invalidate_mesh_cache(update.id.original)
+
+    if not util.handler_can_run(scene, check_ticker=False):
+        return
+
+    changes = get_depsgraph_changes(scene, depsgraph)
+    if not changes:
+        return
+
+    for handler, kinds in DEPSGRAPH_SUBSCRIBERS:
+        if changes.isdisjoint(kinds):
+            continue
+        start = time.perf_counter()
+        try:
+            handler(scene)
+        except Exception:
+            log.exception("Depsgraph handler %s failed" % handler.__name__)
+        stats = HANDLER_STATS.setdefault(handler.__name__, [0, 0.0])
+        stats[0] += 1
+        stats[1] += time.perf_counter() - start
+
 def register_handlers():
 
-    bpy.app.handlers.depsgraph_update_post.append(rig.sync_timeline_action)
-    bpy.app.handlers.depsgraph_update_post.append(rig.check_dirty_armature_on_update)
-    bpy.app.handlers.depsgraph_update_post.append(shape.check_dirty_mesh_on_update)
-    bpy.app.handlers.depsgraph_update_post.append(fix_bone_layers_on_update)
-    bpy.app.handlers.depsgraph_update_post.append(check_for_armatures_on_update)
-    bpy.app.handlers.depsgraph_update_post.append(check_for_system_mesh_edit)
-    bpy.app.handlers.depsgraph_update_post.append(weights.edit_object_change_handler)
-    bpy.app.handlers.depsgraph_update_post.append(rig.fix_linebones_on_update)
+    bpy.app.handlers.depsgraph_update_post.append(dispatch_depsgraph_update)
     bpy.app.handlers.load_post.append(fix_bone_layers_on_load)
     bpy.app.handlers.load_post.append(fix_avastar_data_on_load)
+    bpy.app.handlers.load_post.append(rig.clear_item_cache)
+    bpy.app.handlers.undo_post.append(rig.clear_item_cache)
+    bpy.app.handlers.redo_post.append(rig.clear_item_cache)
+    bpy.app.handlers.load_post.append(util.clear_mesh_cache)
+    bpy.app.handlers.undo_post.append(util.clear_mesh_cache)
+    bpy.app.handlers.redo_post.append(util.clear_mesh_cache)
     bpy.app.handlers.depsgraph_update_post.append(shape.check_dirty_mesh_on_load)
     bpy.app.handlers.frame_change_post.append(shape.update_on_framechange)
     print("Avastar Handlers registered")
@@ -5183,16 +5291,15 @@ def unregister_handlers():
 
     bpy.app.handlers.frame_change_post.remove(shape.update_on_framechange)
     bpy.app.handlers.depsgraph_update_post.remove(shape.check_dirty_mesh_on_load)
+    bpy.app.handlers.redo_post.remove(util.clear_mesh_cache)
+    bpy.app.handlers.undo_post.remove(util.clear_mesh_cache)
+    bpy.app.handlers.load_post.remove(util.clear_mesh_cache)
+    bpy.app.handlers.redo_post.remove(rig.clear_item_cache)
+    bpy.app.handlers.undo_post.remove(rig.clear_item_cache)
+    bpy.app.handlers.load_post.remove(rig.clear_item_cache)
     bpy.app.handlers.load_post.remove(fix_avastar_data_on_load)
     bpy.app.handlers.load_post.remove(fix_bone_layers_on_load)
-    bpy.app.handlers.depsgraph_update_post.remove(rig.fix_linebones_on_update)
-    bpy.app.handlers.depsgraph_update_post.remove(weights.edit_object_change_handler)
-    bpy.app.handlers.depsgraph_update_post.remove(check_for_system_mesh_edit)
-    bpy.app.handlers.depsgraph_update_post.remove(check_for_armatures_on_update)
-    bpy.app.handlers.depsgraph_update_post.remove(fix_bone_layers_on_update)
-    bpy.app.handlers.depsgraph_update_post.remove(shape.check_dirty_mesh_on_update)
-    bpy.app.handlers.depsgraph_update_post.remove(rig.check_dirty_armature_on_update)
-    bpy.app.handlers.depsgraph_update_post.remove(rig.sync_timeline_action)
+    bpy.app.handlers.depsgraph_update_post.remove(dispatch_depsgraph_update)
     print("Avastar Handlers unregistered")
 
 def unregister():
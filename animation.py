@@ -25,6 +25,7 @@
 import bpy, bgl
 from bpy.props import *
 from struct import pack, unpack, calcsize
+from array import array
 from mathutils import Matrix, Vector, Euler, Quaternion
 
 import re, os, logging, gettext
@@ -620,7 +621,12 @@ def exportAnimation(context, action, filepath, mode):
     ANIM['BONE0'] = BONE0
 
 
-    FRAMED = collectVisualTransforms(obj, context, ROTS, LOCS)
+    if mode == 'anim':
+        FRAMED = collectVisualTransforms(obj, context, ROTS, LOCS)
+    else:
+        POSED = {}
+        FRAMED = collectVisualTransforms(obj, context, ROTS, LOCS, POSED=POSED, pose_bones=BVH_ROOT_BONES)
+        ANIM['POSED'] = POSED
 
     if mode == 'anim':
 
@@ -909,10 +915,13 @@ def collectActionBones(obj, action, with_translation):
     return ROTS, LOCS
 
 
-def collectVisualTransforms(obj, context, ROTS, LOCS):
-
-
-
+def collectVisualTransforms(obj, context, ROTS, LOCS, POSED=None, pose_bones=None):
+    '''
+    Sample every frame of the scene range exactly once.
+    Besides the visual transforms of the animated bones
+    the pose matrices of pose_bones are recorded into POSED,
+    so that exporters never need to set the frame again.
+    '''
 
     FRAMED = {}
 
@@ -953,6 +962,13 @@ def collectVisualTransforms(obj, context, ROTS, LOCS):
             except:
                 log.warning("Collect visual transforms from %s:%s failed (ignore)" % (arm.name, bonename))
 
+        if POSED is not None:
+            POSED[frame] = {}
+            for bonename in pose_bones:
+                pbone = arm.pose.bones.get(bonename)
+                if pbone:
+                    parent_pose_mat = pbone.parent.matrix if pbone.parent else Matrix()
+                    POSED[frame][bonename] = {'parent_pose_mat':parent_pose_mat.copy(), 'pose_mat':pbone.matrix.copy()}
 
     context.scene.frame_set(frame_original)
 
@@ -1199,53 +1215,35 @@ def exportAnim(armobj, animationfile, ANIM):
         log.debug("Export %d frames for bone %s (%s)" % (len(BDATA), ename, rotloc))
 
         has_data = False
+        fstart = ANIM["frame_start"]
+        fps    = float(ANIM["fps"])
+        times  = [F32_to_U16(float((f-fstart)/fps), 0, duration) for f in frames]
+        matrices = [BDATA[f].get('visual') for f in frames]
+
         if bname in ANIM['ROTS']:
             has_data = True
             log.debug("Export ROT data of Bone %s" % (ename) )
 
-            data = pack("i", len(BDATA))
-            buff.write(data)
-
-            for f in frames:
-
-
-
-
-
-
-                #
-                
-                matrix = BDATA[f].get('visual')
-
-
-                t = (f-ANIM["frame_start"])/float(ANIM["fps"])
-                time = F32_to_U16(float(t), 0, duration)
-                data = pack("H",time)
-                buff.write(data)
-
-                euler = None
-                try:
-                    r0 = ANIM['BONE0'][bname]['rot0']
-                    rot0 = (r0[0], r0[1], r0[2])
-                    euler = Euler(rot0,'ZYX')
-                except:
-                    log.warning("%s.rot0 seems broken. use (0,0,0)" % (bname) )
-                    euler = Euler((0,0,0),'ZYX')
-
-                M3    = euler.to_matrix()
-                R     = M3.to_4x4() # this is RxRyRz
-                q     = mulmat(Rz90I, matrix, R, Rz90).to_quaternion().normalized()
-
-
-
-                x = F32_to_U16(q.x, -1, 1)
-                y = F32_to_U16(q.y, -1, 1)
-                z = F32_to_U16(q.z, -1, 1)
-                data = pack("HHH", x, y, z)
+            try:
+                r0 = ANIM['BONE0'][bname]['rot0']
+                rot0 = (r0[0], r0[1], r0[2])
+                euler = Euler(rot0,'ZYX')
+            except:
+                log.warning("%s.rot0 seems broken. use (0,0,0)" % (bname) )
+                euler = Euler((0,0,0),'ZYX')
 
+            R  = euler.to_matrix().to_4x4() # this is RxRyRz
+            RR = mulmat(R, Rz90)
 
-                buff.write(data)
+            keys = array('H')
+            for time, matrix in zip(times, matrices):
+                q = mulmat(Rz90I, matrix, RR).to_quaternion().normalized()
+                keys.extend((time,
+                             F32_to_U16(q.x, -1, 1),
+                             F32_to_U16(q.y, -1, 1),
+                             F32_to_U16(q.z, -1, 1)))
 
+            buff.write(pack("i", len(BDATA)) + keys.tobytes())
 
         else:
 
@@ -1257,50 +1255,34 @@ def exportAnim(armobj, animationfile, ANIM):
             has_data = True
             log.debug("Export LOC data of Bone %s" % (ename) )
 
-            data = pack("i", len(BDATA))
-            buff.write(data)
-
-            for f in frames:
-                matrix = BDATA[f].get('visual')
-
+            abone  = ANIM['BONE0'][bname]
+            ts = ANIM['armature_scale'] if ANIM.get('apply_scale', False) else (1,1,1)
 
-
-
-
-                t = (f-ANIM["frame_start"])/float(ANIM["fps"])
-                time = F32_to_U16(float(t), 0, duration)
-                data = pack("H",time)
-                buff.write(data)
-
-                abone  = ANIM['BONE0'][bname]
-                b = armobj.data.bones.get(bname)
-                L = matrix.to_translation()
-                ts = ANIM['armature_scale'] if ANIM.get('apply_scale', False) else (1,1,1)
-
-                try:
-                    rot0   = abone['rot0'] if 'rot0' in abone else Vector((0,0,0))
-                    psx0, psy0, psz0 = abone['pscale0'] if 'pscale0' in abone else Vector((1,1,1))
-                    psx,  psy,  psz  = abone['pscale']  if 'pscale' in abone else Vector((1,1,1))
-                    offset = Vector(abone['offset'])  if 'offset' in abone else Vector((0,0,0))
-
-                    L += offset
-                except:
-                    log.warning("Data corruption in bone %s" % (bname) )
-                    raise
-
-                R = Euler(rot0,'ZYX').to_matrix().to_4x4() # this is RxRyRz
-                S = Matrix()
-                S[0][0] = ts[0]/(psx0+psx)
-                S[1][1] = ts[1]/(psy0+psy)
-                S[2][2] = ts[2]/(psz0+psz)
-
-                L = mulmat(Rz90.inverted(), S, R, L)
-                x = F32_to_U16(L.x/LL_MAX_PELVIS_OFFSET, -1, 1)
-                y = F32_to_U16(L.y/LL_MAX_PELVIS_OFFSET, -1, 1)
-                z = F32_to_U16(L.z/LL_MAX_PELVIS_OFFSET, -1, 1)
-
-                data = pack("HHH",x, y, z)
-                buff.write(data)
+            try:
+                rot0   = abone['rot0'] if 'rot0' in abone else Vector((0,0,0))
+                psx0, psy0, psz0 = abone['pscale0'] if 'pscale0' in abone else Vector((1,1,1))
+                psx,  psy,  psz  = abone['pscale']  if 'pscale' in abone else Vector((1,1,1))
+                offset = Vector(abone['offset'])  if 'offset' in abone else Vector((0,0,0))
+            except:
+                log.warning("Data corruption in bone %s" % (bname) )
+                raise
+
+            R = Euler(rot0,'ZYX').to_matrix().to_4x4() # this is RxRyRz
+            S = Matrix()
+            S[0][0] = ts[0]/(psx0+psx)
+            S[1][1] = ts[1]/(psy0+psy)
+            S[2][2] = ts[2]/(psz0+psz)
+            M = mulmat(Rz90.inverted(), S, R)
+
+            keys = array('H')
+            for time, matrix in zip(times, matrices):
+                L = mulmat(M, matrix.to_translation() + offset)
+                keys.extend((time,
+                             F32_to_U16(L.x/LL_MAX_PELVIS_OFFSET, -1, 1),
+                             F32_to_U16(L.y/LL_MAX_PELVIS_OFFSET, -1, 1),
+                             F32_to_U16(L.z/LL_MAX_PELVIS_OFFSET, -1, 1)))
+
+            buff.write(pack("i", len(BDATA)) + keys.tobytes())
 
         else:
 
@@ -1424,7 +1406,6 @@ def exportBVH(context, armobj, animationfile, ANIM):
         return
 
     frames.sort()
-    frame_original = context.scene.frame_current
 
     if generate_ref:
         line = bvh_create_reference_frame(armobj, hierarchy, export_bone_set, ANIM, frames[0])
@@ -1432,11 +1413,9 @@ def exportBVH(context, armobj, animationfile, ANIM):
         log.warning("Added the reference frame as first frame.")
 
     for frame in frames:
-        context.scene.frame_set(frame)
         line = bvh_create_frame(armobj, hierarchy, export_bone_set, ANIM, frame)
         buff.write("%s\n" % line)
 
-    context.scene.frame_set(frame_original)
     buff.close()    
 
     for bname in summary:
@@ -1515,7 +1494,14 @@ def bvh_hierarchy_recursive(buff, bone, export_bone_set, LOCS, lvl=0):
 
     return hierarchy
 
+BVH_ROOT_BONES = ['mPelvis', 'Pelvis']
+
 def get_bvh_location(armobj, bone_name, ANIM, frame):
+    '''
+    The pose matrices are taken from the sampled frames.
+    Root bones which are not animated come from ANIM['POSED'],
+    see BVH_ROOT_BONES and collectVisualTransforms()
+    '''
 
     LOCS = ANIM['LOCS']
     FRAMED = ANIM['FRAMED']
@@ -1528,12 +1514,12 @@ def get_bvh_location(armobj, bone_name, ANIM, frame):
     loc = None
     if is_root or bone_name in FBONES and bone_name in LOCS:
         db=armobj.data.bones[bone_name]
-        pb=armobj.pose.bones[bone_name]
         dbp=db.parent
         t=Matrix.Translation(db.head_local)
         it=t.inverted()
-        pb_mat = pb.matrix # mats['pose_mat']
-        pbp_mat= pb.parent.matrix if pb.parent else Matrix() # mats['parent_pose_mat']
+        mats = FBONES.get(bone_name) or ANIM['POSED'][frame][bone_name]
+        pb_mat = mats['pose_mat']
+        pbp_mat= mats['parent_pose_mat']
         matf = mulmat(it, dbp.matrix_local, pbp_mat.inverted(), pb_mat, db.matrix_local.inverted(), t)
         off = matf.to_translation()
         bl =  Vector((0,0,0)) if not dbp else (db.head_local - dbp.head_local)
@@ -1820,11 +1806,112 @@ def group_fcurves(source, transforms):
 
 
 
+class ActionPoseSampler:
+    '''
+    Compute pose matrices of an armature directly from the F-Curves
+    of its active action and the rest pose hierarchy. This only works
+    when nothing else drives the pose (no constraints, drivers or NLA)
+    and every bone applies its channels like basis() does, which is
+    the case for rigs created by the BVH importer.
+    '''
+
+    def __init__(self, armobj, bone_names):
+        self.armobj = armobj
+        self.fcurves = {(fc.data_path, fc.array_index):fc for fc in armobj.animation_data.action.fcurves}
+        self.bones = []
+        visited = set()
+        for name in bone_names:
+            dbone = armobj.data.bones.get(name)
+            chain = []
+            while dbone and dbone.name not in visited:
+                visited.add(dbone.name)
+                chain.append(dbone)
+                dbone = dbone.parent
+            self.bones.extend(reversed(chain))
+
+        self.offsets = {}
+        for dbone in self.bones:
+            if dbone.parent:
+                self.offsets[dbone.name] = mulmat(dbone.parent.matrix_local.inverted(), dbone.matrix_local)
+            else:
+                self.offsets[dbone.name] = dbone.matrix_local.copy()
+
+    @staticmethod
+    def is_supported(armobj):
+        animation_data = armobj.animation_data
+        if not (animation_data and animation_data.action):
+            return False
+        if len(animation_data.drivers) > 0 or len(animation_data.nla_tracks) > 0:
+            return False
+        armature = armobj.data
+        if armature.pose_position != 'POSE':
+            return False
+        if armature.animation_data and (armature.animation_data.action or len(armature.animation_data.drivers) > 0):
+            return False
+        for pbone in armobj.pose.bones:
+            if len(pbone.constraints) > 0:
+                return False
+            dbone = pbone.bone
+            if not dbone.use_inherit_rotation or dbone.inherit_scale != 'FULL':
+                return False
+            if not dbone.use_local_location:
+                return False
+        return True
+
+    def evaluate(self, pbone, attr, frame):
+        data_path = pbone.path_from_id(attr)
+        values = list(getattr(pbone, attr))
+        for index in range(len(values)):
+            fcurve = self.fcurves.get((data_path, index))
+            if fcurve:
+                values[index] = fcurve.evaluate(frame)
+        return values
+
+    def basis(self, pbone, frame):
+        if pbone.bone.use_connect:
+            loc = Vector((0,0,0)) # Blender ignores the location of connected bones
+        else:
+            loc = Vector(self.evaluate(pbone, 'location', frame))
+        scale = Vector(self.evaluate(pbone, 'scale', frame))
+        mode = pbone.rotation_mode
+        if mode == 'QUATERNION':
+            rot = Quaternion(self.evaluate(pbone, 'rotation_quaternion', frame)).normalized().to_matrix()
+        elif mode == 'AXIS_ANGLE':
+            angle, x, y, z = self.evaluate(pbone, 'rotation_axis_angle', frame)
+            rot = Matrix.Rotation(angle, 3, Vector((x,y,z)))
+        else:
+            rot = Euler(self.evaluate(pbone, 'rotation_euler', frame), mode).to_matrix()
+
+        S = Matrix.Diagonal(scale)
+        M = mulmat(rot, S).to_4x4()
+        M.translation = loc
+        return M
+
+    def sample(self, frame):
+        '''
+        Return a dictionary of pose matrices (as pbone.matrix) for frame
+        '''
+
+        pbones = self.armobj.pose.bones
+        POSE = {}
+        for dbone in self.bones:
+            pbone = pbones[dbone.name]
+            M = mulmat(self.offsets[dbone.name], self.basis(pbone, frame))
+            if dbone.parent:
+                M = mulmat(POSE[dbone.parent.name], M)
+            POSE[dbone.name] = M
+        return POSE
+
+
 def collectMotionData(context, source, target, target_bone_info, reference_frame, start_frame, end_frame):
 
     MWS  = source.matrix_world
 
-
+    if ActionPoseSampler.is_supported(source):
+        log.warning("Collecting motion Data from the source action curves...")
+        sampler = ActionPoseSampler(source, [channel.source for channel in target_bone_info.values()])
+    else:
+        sampler = None
 
     log.warning("Collecting motion Data...")
     for frame in range(start_frame, end_frame+1):
@@ -1833,7 +1920,10 @@ def collectMotionData(context, source, target, target_bone_info, reference_frame
             log.warning("Skip reference frame %d from collecting frame data" % frame)
             continue
 
-        context.scene.frame_set(frame)
+        if sampler:
+            POSE = sampler.sample(frame)
+        else:
+            context.scene.frame_set(frame)
 
         for key, channel in target_bone_info.items():
 
@@ -1842,7 +1932,7 @@ def collectMotionData(context, source, target, target_bone_info, reference_frame
                 log.warning("Translation map: bone \"%s\" not in source rig %s" % (channel.source, source.name) )
                 continue
 
-            spbm = spb.matrix
+            spbm = POSE[spb.name] if sampler else spb.matrix
             
 
 
@@ -1866,7 +1956,9 @@ def simplifyMotionData(translation, reference_frame, start_frame, end_frame, moc
     if mocap.simplificationMethod == "loweslocal":
         log.warning("simplify Motion Data: simplifying channel curves (Lowes local method, tol=%f)" % (mocap.lowesLocalTol))
         Ni=Nf=0
-        for channel in translation.values():
+        channels = list(translation.values())
+        curves = []
+        for channel in channels:
             curve = []
             
 
@@ -1879,9 +1971,11 @@ def simplifyMotionData(translation, reference_frame, start_frame, end_frame, moc
                 
                 point.extend(channel.frames[frame][1])
                 curve.append(point)
+            curves.append(curve)
 
-
-            channel.sframes = simplifyLowes(curve, 0, len(curve)-1, set(),tol=mocap.lowesLocalTol)
+        sframes = simplifyLowesChannels(curves, tol=mocap.lowesLocalTol)
+        for channel, curve, csframes in zip(channels, curves, sframes):
+            channel.sframes = csframes
 
             Ni+=len(curve)
             Nf+=len(channel.sframes)
@@ -1942,6 +2036,7 @@ def transferActionData(context, source, target, target_bone_info, reference_fram
         source_ref_pose = rig.armatureAsDictionary(source)
         target_ref_pose = rig.armatureAsDictionary(target)
 
+    KEYS = {} if can_write_keys_in_bulk(target) else None
     current_frame = start_frame
     if not keep_reference_frame:
         start_frame += 1
@@ -1957,6 +2052,7 @@ def transferActionData(context, source, target, target_bone_info, reference_fram
         progress += 1
         util.progress_update(progress)
         context.scene.frame_set(frame)
+        apply_last_keys(context, pbones, KEYS)
         rig.armatureFromMocap(context, target, mocap, False, source_ref_pose, target_ref_pose, refloc)
 
         for pbone in pbones:
@@ -1965,14 +2061,132 @@ def transferActionData(context, source, target, target_bone_info, reference_fram
 
             if has_rot:
                 if pbone.rotation_mode=='QUATERNION':
-                    pbone.keyframe_insert(data_path="rotation_quaternion", frame=frame, group=pbone.name)
+                    add_key(KEYS, pbone, "rotation_quaternion", frame)
                 else:
-                    pbone.keyframe_insert(data_path="rotation_euler", frame=frame, group=pbone.name)
+                    add_key(KEYS, pbone, "rotation_euler", frame)
             if has_loc:
-                pbone.keyframe_insert(data_path="location", index=-1, frame=frame, group=pbone.name)
+                add_key(KEYS, pbone, "location", frame)
 
+    write_keys(context, target, KEYS)
     rig.restore_bone_rotation_limit_state(target.pose.bones, old_settings)
 
+def can_write_keys_in_bulk(obj):
+    '''
+    Keys can only be collected and written after the frame loop
+    when nothing animates the pose bones of obj yet. Otherwise
+    frame_set() would evaluate the old curves instead of the keys
+    written so far, and the keys are inserted frame by frame.
+    '''
+
+    animation_data = obj.animation_data
+    if not animation_data:
+        return True
+    if len(animation_data.nla_tracks) > 0:
+        return False
+    action = animation_data.action
+    if action and any(fcurve.data_path.startswith('pose.bones') for fcurve in action.fcurves):
+        return False
+    return True
+
+def apply_last_keys(context, pbones, KEYS):
+    '''
+    Put the pose back to the last collected keys, which is
+    what frame_set() returns once the keys have been inserted.
+    Nothing else animates the pose bones, so they usually still
+    hold these values and the pose needs no evaluation.
+    '''
+
+    if not KEYS:
+        return
+
+    changed = False
+    for (bname, attr), (frames, values) in KEYS.items():
+        pbone = pbones[bname]
+        if tuple(getattr(pbone, attr)) != values[-1]:
+            setattr(pbone, attr, values[-1])
+            changed = True
+    if changed:
+        context.view_layer.update()
+
+def add_key(KEYS, pbone, attr, frame):
+    if KEYS is None:
+        pbone.keyframe_insert(data_path=attr, frame=frame, group=pbone.name)
+        return
+
+    frames, values = KEYS.setdefault((pbone.name, attr), ([],[]))
+    frames.append(frame)
+    values.append(tuple(getattr(pbone, attr)))
+
+def write_keys(context, obj, KEYS):
+    '''
+    Write the collected keys into the active action of obj.
+    Each F-Curve is filled with one keyframe_points.add()
+    and foreach_set() calls instead of a keyframe_insert per key.
+    '''
+
+    if not KEYS:
+        return
+
+    edit = context.preferences.edit
+    interpolation = edit.keyframe_new_interpolation_type
+    handle_type = edit.keyframe_new_handle_type
+
+    if obj.animation_data is None:
+        obj.animation_data_create()
+    action = obj.animation_data.action
+    if action is None:
+        action = bpy.data.actions.new("%sAction" % obj.name)
+        obj.animation_data.action = action
+
+    pbones = obj.pose.bones
+    for (bname, attr), (frames, values) in KEYS.items():
+        data_path = pbones[bname].path_from_id(attr)
+        for index in range(len(values[0])):
+            write_fcurve_keys(action, data_path, index, bname, frames, [v[index] for v in values], interpolation, handle_type)
+
+def write_fcurve_keys(action, data_path, index, group, frames, values, interpolation, handle_type):
+    fcurve = action.fcurves.find(data_path, index=index)
+    if not fcurve:
+        fcurve = action.fcurves.new(data_path, index=index, action_group=group)
+
+    points = fcurve.keyframe_points
+    count = len(points)
+    co = array('f', [0.0]) * (2*count)
+    if count:
+        points.foreach_get('co', co)
+    known = {co[2*i]:i for i in range(count)}
+
+    added = 0
+    for frame, value in zip(frames, values):
+        i = known.get(frame)
+        if i is None:
+            co.append(frame)
+            co.append(value)
+            added += 1
+        else:
+            co[2*i+1] = value
+
+    points.add(added)
+    points.foreach_set('co', co)
+    for handle in ['handle_left', 'handle_right']:
+        handles = array('f', [0.0]) * (2*count)
+        if count:
+            points.foreach_get(handle, handles)
+        handles.extend(co[2*count:])
+        points.foreach_set(handle, handles)
+
+    # keyframe_points.add() creates BEZIER keys with AUTO_CLAMPED handles.
+    # Enum properties can not be written with foreach_set()
+    if interpolation != 'BEZIER' or handle_type != 'AUTO_CLAMPED':
+        for i in range(count, count+added):
+            point = points[i]
+            if interpolation != 'BEZIER':
+                point.interpolation = interpolation
+            if handle_type != 'AUTO_CLAMPED':
+                point.handle_left_type = handle_type
+                point.handle_right_type = handle_type
+    fcurve.update()
+
 def has_keyframes(context, frame, pbone, target_bone_info):
     has_rot = False
     has_loc = False
@@ -2065,44 +2279,77 @@ class TargetBoneInfo:
 
 
 
-def simplifyLowes(curve, i,f, simplified, tol=.1):
+def findLowesSplit(points, i, f):
+    '''
+    Return the index and distance of the point between i and f
+    which is farthest away from the line points[i]-points[f]
+    '''
 
-    #
+    A = points[i]
+    B = points[f]
+    AB = [a-b for a,b in zip(A,B)]
+    ABAB = sum([x*x for x in AB])
 
+    maxd = 0
+    maxi = 0
+    for ii in range(i+1,f):
+        AP = [a-p for a,p in zip(A,points[ii])]
+        ABAP = sum([x*y for x,y in zip(AB,AP)])
+        APAP = sum([x*x for x in AP])
+        d = sqrt(abs(APAP-ABAP**2/ABAB))
+        if d > maxd:
+            maxd = d
+            maxi = ii
 
+    return maxi, maxd
 
 
+def simplifyLowes(curve, i,f, simplified, tol=.1):
+    '''
+    Douglas-Peucker reduction of curve[i:f+1]. The frame numbers
+    of the kept points are added to simplified. The spans are
+    processed from a stack, so long curves do not hit the
+    recursion limit.
+    '''
 
+    points = [tuple(p) for p in curve]
+    spans = [(i,f)]
+    while spans:
+        i,f = spans.pop()
+        simplified.add(points[i][0])
+        simplified.add(points[f][0])
+        if f-i < 2:
+            continue
 
- 
-    pl1 = curve[i]
-    pl2 = curve[f]
-    
+        maxi, maxd = findLowesSplit(points, i, f)
+        if maxd > tol:
+            spans.append((maxi,f))
+            spans.append((i,maxi))
 
-    simplified.add(pl1[0])
-    simplified.add(pl2[0])
-    
-    maxd = 0
-    maxi = 0
+    return simplified
 
-    for ii in range(i+1,f):
-        p = curve[ii]
-        d = distanceToLine(p,pl1,pl2)
-        if d > maxd:
-            maxd = d
-            maxi = ii
-            
-    if maxd > tol:
-        
-        if maxi==f-1:
-            simplified.add(curve[maxi][0])
-        else:
-            simplified = simplifyLowes(curve, maxi, f, simplified, tol=tol)
 
-        if maxi==i+1:
-            simplified.add(curve[maxi][0])
-        else:
-            simplified = simplifyLowes(curve, i, maxi, simplified, tol=tol)
+def simplifyLowesChannels(curves, tol=.1):
+    '''
+    Run simplifyLowes on a list of curves in one batch
+    and return the list of kept frame sets
+    '''
+
+    points = [[tuple(p) for p in curve] for curve in curves]
+    simplified = [set() for curve in curves]
+    spans = [(c, 0, len(curve)-1) for c, curve in enumerate(points) if curve]
+    while spans:
+        c,i,f = spans.pop()
+        curve = points[c]
+        simplified[c].add(curve[i][0])
+        simplified[c].add(curve[f][0])
+        if f-i < 2:
+            continue
+
+        maxi, maxd = findLowesSplit(curve, i, f)
+        if maxd > tol:
+            spans.append((c,maxi,f))
+            spans.append((c,i,maxi))
 
     return simplified
 
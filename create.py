@@ -23,6 +23,7 @@
 # ##### END GPL LICENSE BLOCK #####
 import bpy
 import os, logging, gettext, time
+from array import array
 from math import pi, sin, cos, radians
 
 from bpy.props import *
@@ -329,10 +330,12 @@ def add_welding(parts, from_name, to_name):
 def createMesh(context, name, llm_mesh):
 
 
-    verts = [llm_mesh['baseCoords'][i] for i in llm_mesh['vertLookup']]
-    faces = llm_mesh['faces'] # a list of face 3-tuples
-    vt = llm_mesh['texCoords'] # vertex (x,y) coords
-    normals = llm_mesh['baseNormals']
+    vertLookup = llm_mesh['vertLookup']
+    inverse = llm_mesh['vertexIndex']
+    verts = [llm_mesh['baseCoords'][i] for i in vertLookup]
+    corners = llm_mesh['faceArray'] # the face 3-tuples, flattened
+    vt = llm_mesh['texCoordArray'] # vertex (x,y) coords, flattened
+    normals = llm_mesh['normalArray']
     if "noseams" in llm_mesh:
         noseams    = llm_mesh['noseams']
         extraseams = llm_mesh['extraseams']
@@ -342,10 +345,8 @@ def createMesh(context, name, llm_mesh):
         extraseams = []
         extrapins  = []
 
-    meshFaces = []
-    for f in faces:
-        fv = [data.getVertexIndex(llm_mesh, v) for v in f]
-        meshFaces.append(fv)
+    fv = [inverse[v] for v in corners]
+    meshFaces = [fv[i:i+3] for i in range(0, len(fv), 3)]
     
 
     bpy.ops.object.select_all(action="DESELECT")
@@ -366,13 +367,21 @@ def createMesh(context, name, llm_mesh):
     mesh.update(calc_edges=True)
 
 
-    for e in mesh.edges:
-        if not e.index in noseams:
-            a, b = e.vertices
-            if e.index in extraseams \
-               or ( llm_mesh['vertLookup'][a] in llm_mesh['vertexRemap'].values() and \
-                    llm_mesh['vertLookup'][b] in llm_mesh['vertexRemap'].values()) :
-                e.use_seam = True
+    noseams    = set(noseams)
+    extraseams = set(extraseams)
+    remapped   = set(llm_mesh['vertexRemap'].values())
+    edge_verts = array('i', [0]) * (2*len(mesh.edges))
+    mesh.edges.foreach_get('vertices', edge_verts)
+    use_seam = [False] * len(mesh.edges)
+    for index in range(len(mesh.edges)):
+        if not index in noseams:
+            a = edge_verts[2*index]
+            b = edge_verts[2*index+1]
+            if index in extraseams \
+               or ( vertLookup[a] in remapped and \
+                    vertLookup[b] in remapped) :
+                use_seam[index] = True
+    mesh.edges.foreach_set('use_seam', use_seam)
 
     mesh.update(calc_edges=True)
     util.update_view_layer(context)
@@ -398,9 +407,10 @@ def createMesh(context, name, llm_mesh):
 
 
 
-    for v, normal in enumerate(normals):
-        if v not in llm_mesh['vertexRemap']:
-            mesh.vertices[data.getVertexIndex(llm_mesh, v)].normal = normal
+    vertex_normals = array('f')
+    for v in vertLookup:
+        vertex_normals.extend(normals[3*v:3*v+3])
+    mesh.vertices.foreach_set('normal', vertex_normals)
 
 
 
@@ -434,12 +444,15 @@ def createMesh(context, name, llm_mesh):
     uv_layers = util.get_uv_layers(mesh)
     index    = util.get_uv_index_for_layer(mesh, uv.name)
     uvloops  = mesh.uv_layers[index].data
-    loops    = mesh.loops
-    polygons = mesh.polygons
-    for i, face in enumerate(faces):
-        for j in range(3):
-            loop = polygons[i].loop_indices[j]
-            uvloops[loop].uv = vt[face[j]]
+    loop_vertex = array(corners.typecode, [0]) * len(mesh.loops)
+    loop_start  = array('i', [0]) * len(mesh.polygons)
+    mesh.polygons.foreach_get('loop_start', loop_start)
+    for i, start in enumerate(loop_start):
+        loop_vertex[start:start+3] = corners[3*i:3*i+3]
+    uvs = array('f')
+    for v in loop_vertex:
+        uvs.extend(vt[2*v:2*v+2])
+    uvloops.foreach_set('uv', uvs)
                     
 
     obj.shape_key_add(name="Basis")
@@ -460,12 +473,23 @@ def createShapekey(obj, pid, morph, mesh):
     key.value      = morph['value_default']
     
 
-    for v in morph['vertices']:
+    remap   = mesh['vertexRemap']
+    inverse = mesh['vertexIndex']
+    base    = mesh['coordArray']
+    coords  = morph['coordArray']
+    co = array('f', [0.0]) * (3*len(key.data))
+    key.data.foreach_get('co', co)
+    for n, ii in enumerate(morph['indexArray']):
 
-        if v['vertexIndex'] in mesh['vertexRemap']:
+        if ii in remap:
             continue
-        i = data.getVertexIndex(mesh, v['vertexIndex'])
-        key.data[i].co = Vector(mesh['baseCoords'][v['vertexIndex']]) + Vector(v['coord'])
+        i = 3*inverse[ii]
+        b = 3*ii
+        d = 3*n
+        co[i]   = base[b]   + coords[d]
+        co[i+1] = base[b+1] + coords[d+1]
+        co[i+2] = base[b+2] + coords[d+2]
+    key.data.foreach_set('co', co)
 
 
 
@@ -489,15 +513,24 @@ def createMeshGroups(obj, mesh):
 
 
     name = mesh['name']
-    for ii in range(len( mesh['weights'] )):
+    inverse = mesh['vertexIndex']
+    GROUPS = {}
+    for ii, (b,w) in enumerate(mesh['weights']):
         if ii in mesh['vertexRemap']:
             continue
-        i = data.getVertexIndex(mesh, ii)
-        b,w = mesh['weights'][ii]
+        i = inverse[ii]
         b1, b2 = data.WEIGHTSMAP[name][b]
-        obj.vertex_groups[b1].add([i], 1.0-w, 'REPLACE')
+        GROUPS.setdefault(b1, {})[i] = 1.0-w
         if b2 is not None and w!=0:
-            obj.vertex_groups[b2].add([i], w, 'REPLACE')
+            GROUPS.setdefault(b2, {})[i] = w
+
+    for gname, weights in GROUPS.items():
+        WEIGHTS = {}
+        for i, w in weights.items():
+            WEIGHTS.setdefault(w, []).append(i)
+        group = obj.vertex_groups[gname]
+        for w, indices in WEIGHTS.items():
+            group.add(indices, w, 'REPLACE')
 
 
 def add_initial_rotation(pbone, delta):
@@ -22,9 +22,10 @@
 #
 # ##### END GPL LICENSE BLOCK #####
 
-import bpy, os, logging
+import bpy, os, sys, logging, pickle, copyreg
 import  xml.etree.ElementTree as et
 from struct import unpack
+from array import array
 from math import radians
 from mathutils import Euler, Vector
 from . import util, const
@@ -214,20 +215,148 @@ def get_selected_bones(armobj, weightBoneSelection, rig_sections, excludes):
 
 
 def getVertexIndex(mesh, vertex):
+    inverse = mesh.get('vertexIndex')
+    if inverse is not None:
+        return inverse[vertex]
+
     vmap = mesh['vertexRemap']
     vi = vmap[vertex] if vertex in vmap else vertex
     return(mesh['vertLookup'].index(vi))
 
 
+def get_inverse_lookup(vertLookup, vertexRemap, numVertices):
+    '''
+    Return an array mapping every llm vertex index to its
+    index in the created mesh (as getVertexIndex does)
+    '''
+
+    inverse = array('i', [-1]) * numVertices
+    for i, vi in enumerate(vertLookup):
+        inverse[vi] = i
+    for vertex, vi in vertexRemap.items():
+        inverse[vertex] = inverse[vi]
+    return inverse
+
+
+
+class LLMView:
+    '''
+    Read only sequence view over a packed llm array.
+    Keeps the per element access of the former list
+    based llm layout (one tuple or Vector per vertex)
+    '''
+
+    def __init__(self, values, dim, factory=tuple):
+        self.values  = values
+        self.dim     = dim
+        self.factory = factory
+
+    def __len__(self):
+        return len(self.values) // self.dim
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if index < 0 or index >= len(self):
+            raise IndexError("llm view index out of range")
+        i = index * self.dim
+        return self.factory(self.values[i:i+self.dim])
+
+    def __iter__(self):
+        values  = self.values
+        dim     = self.dim
+        factory = self.factory
+        for i in range(0, len(values), dim):
+            yield factory(values[i:i+dim])
+
+
+class LLMWeightView(LLMView):
+    '''
+    Presents the raw llm weights as (joint index, weight) tuples
+    '''
+
+    def __init__(self, values):
+        LLMView.__init__(self, values, 1, factory=weight_tuple_from_llm)
+
+
+class LLMMorphView(LLMView):
+    '''
+    Presents the packed morph arrays as the former
+    list of morph vertex dictionaries
+    '''
+
+    def __init__(self, morph):
+        LLMView.__init__(self, morph['indexArray'], 1)
+        self.morph = morph
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if index < 0 or index >= len(self):
+            raise IndexError("morph view index out of range")
+        return self.vertex(index)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self.vertex(index)
+
+    def vertex(self, index):
+        morph = self.morph
+        i3 = 3 * index
+        i2 = 2 * index
+        return {'vertexIndex': morph['indexArray'][index],
+                'coord'      : Vector(morph['coordArray'][i3:i3+3]),
+                'normal'     : Vector(morph['normalArray'][i3:i3+3]),
+                'binormal'   : Vector(morph['binormalArray'][i3:i3+3]),
+                'texCoord'   : tuple(morph['texCoordArray'][i2:i2+2])
+               }
+
+
+def weight_from_llm(raw):
+    idx = int(raw)
+    return idx-1, raw-idx
+
+
+def weight_tuple_from_llm(values):
+    return weight_from_llm(values[0])
+
+
+def read_llm_array(stream, typecode, count):
+    values = array(typecode)
+    values.frombytes(stream.read(values.itemsize * count))
+    if sys.byteorder != 'little':
+        values.byteswap()
+    return values
+
+
+def read_llm_string(stream, size):
+    return stream.read(size).decode('utf-8').split("\x00")[0]
+
+
+def s2b_array(values):
+    '''
+    Convert a packed array of SL coordinates into Blender
+    coordinates (see util.s2b) in one pass over the array
+    '''
+    result = array('f', values)
+    result[0::3] = values[1::3]
+    result[1::3] = array('f', [-v for v in values[0::3]])
+    return result
+
 
 def loadLLM(name, filename):
     '''
     load and parse binary mesh file (llm)
+
+    Every section of the file is read in one chunk into
+    packed arrays (float32 for coordinates, uint16 for faces).
+    The former list based keys (baseCoords, faces, morph vertices, ...)
+    are kept as read only views onto these arrays.
     '''
 
     stream = open( filename, 'rb' )
     llm = {}
-    llm['header'] = stream.read(24).decode('utf-8').split( "\x00" )[0]
+    llm['header'] = read_llm_string(stream, 24)
     hasWeights = unpack( "B", stream.read(1) )[0]
     hasDetailTexCoords = unpack( "B", stream.read(1) )[0]
     llm['position'] = unpack( "<3f", stream.read(12) )
@@ -255,68 +384,45 @@ def loadLLM(name, filename):
         shift = (0,0,0)    
     
 
-    llm['baseCoords'] = []
-    for i in range(numVertices):
-        co = unpack("<3f", stream.read(12)) 
-        llm['baseCoords'].append(s2b((co[0]*scale[0]+shift[0], co[1]*scale[1]+shift[1], co[2]*scale[2]+shift[2])))
-        
-    llm['baseNormals'] = []
-    for i in range(numVertices):
-        llm['baseNormals'].append( s2b(unpack( "<3f", stream.read(12) )))
-        
-    llm['baseBinormals'] = []
-    for i in range(numVertices):
-        llm['baseBinormals'].append( s2b(unpack( "<3f", stream.read(12) )))
-    
+    coords = read_llm_array(stream, 'f', 3*numVertices)
+    if scale != (1,1,1) or shift != (0,0,0):
+        for axis in range(3):
+            s = scale[axis]
+            o = shift[axis]
+            coords[axis::3] = array('f', [v*s+o for v in coords[axis::3]])
 
-    llm['texCoords'] = []
-    for i in range(numVertices):
-        llm['texCoords'].append( unpack( "<2f", stream.read(8) ))
-    
-
-    if hasDetailTexCoords:
-        llm['detailTexCoords'] = []
-        for i in range(numVertices):
-            llm['detailTexCoords'].append( unpack( "<2f", stream.read(8) ))
-    
-
-
-    #
+    llm['coordArray']    = s2b_array(coords)
+    llm['normalArray']   = s2b_array(read_llm_array(stream, 'f', 3*numVertices))
+    llm['binormalArray'] = s2b_array(read_llm_array(stream, 'f', 3*numVertices))
+    llm['texCoordArray'] = read_llm_array(stream, 'f', 2*numVertices)
 
+    llm['baseCoords']    = LLMView(llm['coordArray'], 3, Vector)
+    llm['baseNormals']   = LLMView(llm['normalArray'], 3, Vector)
+    llm['baseBinormals'] = LLMView(llm['binormalArray'], 3, Vector)
+    llm['texCoords']     = LLMView(llm['texCoordArray'], 2)
 
+    if hasDetailTexCoords:
+        llm['detailTexCoordArray'] = read_llm_array(stream, 'f', 2*numVertices)
+        llm['detailTexCoords'] = LLMView(llm['detailTexCoordArray'], 2)
 
-
-
-
-
-
-
-    #
-
-    #
     if hasWeights:
-        llm['weights'] = []
-        for i in range(numVertices):
-            raw = unpack( "<f", stream.read(4) )[0]
-            idx = int(raw)-1
-            iweight = raw-int(raw)
-            llm['weights'].append( (idx, iweight) )
+        llm['weightArray'] = read_llm_array(stream, 'f', numVertices)
             
     if name == "eyeBallLeftMesh" or name == "eyeBallRightMesh":
-        llm['weights'] = [(0,0.0)]*numVertices
+        llm['weightArray'] = array('f', [1.0]) * numVertices
+
+    if 'weightArray' in llm:
+        llm['weights'] = LLMWeightView(llm['weightArray'])
 
 
     numFaces = unpack( "<H", stream.read(2) )[0]
-    llm['faces'] = []
-    for i in range(numFaces):
-        llm['faces'].append( unpack( "<3H", stream.read(6) ))
+    llm['faceArray'] = read_llm_array(stream, 'H', 3*numFaces)
+    llm['faces'] = LLMView(llm['faceArray'], 3)
     
 
     if hasWeights:
         numSkinJoints = unpack( "<H", stream.read(2) )[0]
-        llm['skinJoints'] = []
-        for i in range(numSkinJoints):
-            llm['skinJoints'].append(stream.read(64).decode('utf-8').split("\x00")[0])
+        llm['skinJoints'] = [read_llm_string(stream, 64) for i in range(numSkinJoints)]
         
     if name == "eyeBallLeftMesh":
         llm['skinJoints'] = ['mEyeLeft']
@@ -324,36 +430,130 @@ def loadLLM(name, filename):
         llm['skinJoints'] = ['mEyeRight']
 
     llm['morphsbyname'] = {}
-    n = stream.read(64).decode('utf-8').split("\x00")[0]
+    n = read_llm_string(stream, 64)
     while n != "End Morphs":
         morph = {'name':n}
         numMorphVertices = unpack( "<L", stream.read(4) )[0]
-        morph['vertices'] = []
-        for i in range(numMorphVertices):
-            v = {}
-            v['vertexIndex'] = unpack( "<L", stream.read(4) )[0] # 0-indexed
-            v['coord'] = s2b(unpack( "<3f", stream.read(12) ))
-            v['normal'] = s2b(unpack( "<3f", stream.read(12) ))
-            v['binormal'] = s2b(unpack( "<3f", stream.read(12) ))
-            v['texCoord'] = unpack( "<2f", stream.read(8) )
-            morph['vertices'].append( v )
+        raw = stream.read(48 * numMorphVertices)
+
+        floats = array('f')
+        floats.frombytes(raw)
+        indices = array('I')
+        indices.frombytes(raw)
+        if sys.byteorder != 'little':
+            floats.byteswap()
+            indices.byteswap()
+
+        coords    = array('f', [0.0]) * (3*numMorphVertices)
+        normals   = array('f', coords)
+        binormals = array('f', coords)
+        texcoords = array('f', [0.0]) * (2*numMorphVertices)
+        for axis in range(3):
+            coords[axis::3]    = floats[1+axis::12]
+            normals[axis::3]   = floats[4+axis::12]
+            binormals[axis::3] = floats[7+axis::12]
+        texcoords[0::2] = floats[10::12]
+        texcoords[1::2] = floats[11::12]
+
+        morph['indexArray']    = indices[0::12] # 0-indexed
+        morph['coordArray']    = s2b_array(coords)
+        morph['normalArray']   = s2b_array(normals)
+        morph['binormalArray'] = s2b_array(binormals)
+        morph['texCoordArray'] = texcoords
+        morph['vertices']      = LLMMorphView(morph)
+
         llm['morphsbyname'][n] = morph
-        n = stream.read(64).decode('utf-8').split("\x00")[0]
+        n = read_llm_string(stream, 64)
         
 
     numRemaps = unpack( "<l", stream.read(4) )[0]
-    map = {}
-    llm['vertexRemap'] = map
-    for i in range(numRemaps):
-        remap = unpack( "<2l", stream.read(8) )
-        map[ remap[0] ] = remap[1]
+    remaps = read_llm_array(stream, 'i', 2*numRemaps)
     stream.close()
 
-    llm['vertLookup'] = [i for i in range(len(llm['baseCoords'])) if i  not in map]
+    map = dict(zip(remaps[0::2], remaps[1::2]))
+    llm['vertexRemap'] = map
+    llm['vertLookup'] = [i for i in range(numVertices) if i  not in map]
+    llm['vertexIndex'] = get_inverse_lookup(llm['vertLookup'], map, numVertices)
 
     return llm
 
 
+#
+# Binary cache for the parsed avatar definition.
+# The cache files are stamped with the addon version, the cache
+# format and the size/mtime of every source file they were built from.
+# Bump CACHE_FORMAT whenever the layout of a cached structure changes.
+#
+CACHE_FORMAT = 5
+CACHE_DIR    = os.path.join(TMP_DIR, 'cache')
+MESH_SOURCES = []
+
+def reduce_vector(v):
+    return Vector, (tuple(v),)
+
+def get_cache_file(name):
+    return os.path.join(CACHE_DIR, "%s.cache" % name)
+
+def get_cache_stamp(sources):
+    stamp = {'format' : CACHE_FORMAT,
+             'version': util.get_addon_version(),
+             'sources': []}
+    for source in sources:
+        st = os.stat(source)
+        stamp['sources'].append((source, st.st_size, st.st_mtime))
+    return stamp
+
+def is_valid_cache_stamp(stamp):
+    try:
+        sources = [source for source, size, mtime in stamp['sources']]
+        if not sources or sources[0] != util.get_lad_file():
+            return False
+        return stamp == get_cache_stamp(sources)
+    except Exception:
+        return False
+
+def load_cache(name):
+    '''
+    Return the cached data for name, or None when
+    the cache is missing or does not match its sources
+    '''
+    filename = get_cache_file(name)
+    if not os.path.exists(filename):
+        return None, None
+
+    try:
+        with open(filename, 'rb') as f:
+            stamp = pickle.load(f)
+            if not is_valid_cache_stamp(stamp):
+                log.info("Cache %s is outdated" % name)
+                return None, None
+            payload = pickle.loads(f.read())
+    except Exception as e:
+        log.warning("Can not read cache %s (%s)" % (name, e))
+        return None, None
+
+    sources = [source for source, size, mtime in stamp['sources']]
+    return payload, sources
+
+def save_cache(name, payload, sources):
+    filename = get_cache_file(name)
+    try:
+        stamp = get_cache_stamp(sources)
+        if not os.path.exists(CACHE_DIR):
+            os.makedirs(CACHE_DIR)
+
+        tmpname = filename + ".tmp"
+        with open(tmpname, 'wb') as f:
+            pickle.dump(stamp, f, pickle.HIGHEST_PROTOCOL)
+            pickler = pickle.Pickler(f, pickle.HIGHEST_PROTOCOL)
+            pickler.dispatch_table = copyreg.dispatch_table.copy()
+            pickler.dispatch_table[Vector] = reduce_vector
+            pickler.dump(payload)
+        os.replace(tmpname, filename)
+    except Exception as e:
+        log.warning("Can not write cache %s (%s)" % (name, e))
+
+
 def cleanId(nid, name):
 
     #
@@ -379,6 +579,18 @@ def cleanId(nid, name):
 
 
 def loadDrivers(max_param_id=-1):
+    '''
+    Return the shape drivers, from the binary cache when possible
+    '''
+    name = "drivers_%d" % max_param_id
+    DRIVERS, sources = load_cache(name)
+    if DRIVERS is None:
+        DRIVERS = loadDriversFromFile(max_param_id)
+        save_cache(name, DRIVERS, [util.get_lad_file()])
+    return DRIVERS
+
+
+def loadDriversFromFile(max_param_id=-1):
     '''
     Read in shape drivers from avatar_lad.xml
     '''
@@ -407,6 +619,7 @@ def loadDrivers(max_param_id=-1):
     ladxml = et.parse(util.get_lad_file())
 
     DRIVERS = {}
+    PIDS    = {} # numeric param id -> pid, first definition wins
     
     #
 
@@ -473,6 +686,7 @@ def loadDrivers(max_param_id=-1):
                     DRIVERS[pid].append(paramd)
                 else:
                     DRIVERS[pid] = [paramd]
+                    PIDS.setdefault(str(id), pid)
 
     #
 
@@ -525,6 +739,7 @@ def loadDrivers(max_param_id=-1):
             logging.error("unexpected duplicate pid: %s", pid)
         else:
             DRIVERS[pid] = [paramd]
+            PIDS.setdefault(str(id), pid)
 
     #
 
@@ -567,14 +782,7 @@ def loadDrivers(max_param_id=-1):
             ##
 
 
-            nid="_"+d.get('id')
-
-            did = None
-            for driver in DRIVERS.keys():
-                if driver.endswith(nid):
-                    did=driver
-                    break
-
+            did = PIDS.get(d.get('id'))
             if did is None:
 
                 continue
@@ -594,8 +802,9 @@ def loadDrivers(max_param_id=-1):
             logging.error("unexpected duplicate pid: %s", pid)
         else:
             DRIVERS[pid] = [paramd]
-                
-    
+            PIDS.setdefault(str(id), pid)
+
+
     return DRIVERS
 
 SEAM_EXCEPTIONS = {}
@@ -708,14 +917,35 @@ def has_avastar_shapekeys(ob):
 
 def loadMeshes():
     '''
-    Load the mesh details from avatar_lad.xml and the .llm files
+    Load the mesh details, from the binary cache when possible
     '''
     global MESHES
     if len(MESHES) > 0:
         return MESHES
 
+    global MESH_SOURCES
+    cached, sources = load_cache("meshes")
+    if cached is None:
+        sources = loadMeshesFromFile()
+        save_cache("meshes", MESHES, sources)
+    else:
+        MESHES.update(cached)
+        for meshd in MESHES.values():
+            SHAPEKEYS.update(meshd['morphs'])
+
+    MESH_SOURCES = sources
+    return MESHES
+
+
+def loadMeshesFromFile():
+    '''
+    Load the mesh details from avatar_lad.xml and the .llm files
+    and return the list of parsed source files
+    '''
     global SHAPEKEYS
-    ladxml = et.parse(util.get_lad_file())
+    ladfile = util.get_lad_file()
+    ladxml = et.parse(ladfile)
+    sources = [ladfile]
 
     logging.info("Loading avatar data")
 
@@ -732,7 +962,9 @@ def loadMeshes():
 
 
 
-        meshd = loadLLM(name, os.path.join(DATAFILESDIR,file_name))
+        llmfile = os.path.join(DATAFILESDIR,file_name)
+        meshd = loadLLM(name, llmfile)
+        sources.append(llmfile)
         meshd['name'] = name
        
 
@@ -772,7 +1004,7 @@ def loadMeshes():
             morph['value_max']     = float(p.get('value_max'))
             morph['value_default'] = float(p.get('value_default', 0))
 
-    return MESHES
+    return sources
 
 
 
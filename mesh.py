@@ -24,13 +24,14 @@
 # ##### END GPL LICENSE BLOCK #####
 
 import bpy, bmesh, sys
+from array import array
 from mathutils import Vector, Matrix
 from mathutils.kdtree import KDTree
 import  xml.etree.ElementTree as et
 import xmlrpc.client
 from bpy_extras.io_utils import ExportHelper
 from bpy.props import *
-import logging, gettext, os, time, re, shutil, threading
+import logging, gettext, os, time, re, shutil, tempfile, threading
 from math import pi, exp, degrees
 
 from . import animation, armature_util, bind, const, create, data, messages, util, rig, shape, bl_info, weights, propgroups
@@ -1551,7 +1552,7 @@ class ButtonFindUnweighted(bpy.types.Operator):
                     continue
 
 
-                report = findWeightProblemVertices(context, obj, use_sl_list=False, find_selected_armature=True)
+                report = findWeightProblemVertices(context, obj, use_sl_list=False, find_selected_armature=True, use_cache=True)
                 
                 if 'no_armature' in report['status']:
                     raise util.Warning(msg_no_armature + 'find_unweighted'%obj.name)
@@ -1613,7 +1614,7 @@ class ButtonFindZeroWeights(bpy.types.Operator):
                     continue
        
 
-                report = findWeightProblemVertices(context, obj, use_sl_list=False, find_selected_armature=True, minweight=self.min_weight)
+                report = findWeightProblemVertices(context, obj, use_sl_list=False, find_selected_armature=True, minweight=self.min_weight, use_cache=True)
                 
                 if 'no_armature' in report['status']:
                     raise util.Warning(msg_no_armature + 'find_zeroweights'%obj.name)
@@ -1670,7 +1671,8 @@ class ButtonFindTooManyWeights(bpy.types.Operator):
                          use_sl_list=False,
                          find_selected_armature=True,
                          max_weight=self.max_weight,
-                         only_deform=self.only_deform )
+                         only_deform=self.only_deform,
+                         use_cache=True)
                 
 
 
@@ -1860,25 +1862,60 @@ Copy the mirrored location of each selected vertex'''
 
         return{'FINISHED'}    
 
-def findWeightProblemVertices(context, obj, use_sl_list=True, armature=None, find_selected_armature=False, max_weight=4, only_deform=True, minweight=0):
-    
-    def add_non_deforming_group(groupset, bonename):
-        if bonename not in groupset:
-            groupset[bonename] = 1
-        else:
-            groupset[bonename] = groupset[bonename] + 1
-
-
-    #
-
-
-
-
+def get_weight_matrix(obj, use_cache=False):
+    '''
+    Return the vertex group assignments of all vertices of obj as
+    (counts, groups, weights) arrays, where counts holds the number
+    of groups per vertex. With use_cache the arrays are cached until
+    the next depsgraph update of the mesh. That update only happens
+    after an operator has finished, so use_cache is only safe for
+    analysis done before the calling operator changes any weights.
+    '''
 
-    #
+    use_cache = use_cache and obj.mode != 'EDIT'
+    cache = util.get_mesh_cache(obj.data)
+    matrix = cache.get('weight_matrix') if use_cache else None
+    if matrix is None:
+        counts  = array('I')
+        groups  = array('i')
+        weights = array('f')
+        for v in obj.data.vertices:
+            vgroups = v.groups
+            counts.append(len(vgroups))
+            for g in vgroups:
+                groups.append(g.group)
+                weights.append(g.weight)
+        matrix = (counts, groups, weights)
+        if use_cache:
+            cache['weight_matrix'] = matrix
+    return matrix
+
+
+def get_deform_mask(obj, armature, deform_bones=None):
+    '''
+    Return a list with one entry per vertex group of obj:
+    1 for deforming bones, 2 for non deforming bones, 0 otherwise.
+    Without an armature every group counts as deforming.
+    '''
 
+    if armature is None:
+        return [1] * len(obj.vertex_groups)
+
+    bones = armature.data.bones
+    mask = []
+    for group in obj.vertex_groups:
+        bone = bones.get(group.name)
+        if not bone:
+            mask.append(0)
+        elif bone.use_deform and (deform_bones is None or group.name in deform_bones):
+            mask.append(1)
+        else:
+            mask.append(2)
+    return mask
 
 
+def findWeightProblemVertices(context, obj, use_sl_list=True, armature=None, find_selected_armature=False, max_weight=4, only_deform=True, minweight=0, use_cache=False):
+    
     if obj.mode=='EDIT':
         obj.update_from_editmode()
 
@@ -1901,34 +1938,21 @@ def findWeightProblemVertices(context, obj, use_sl_list=True, armature=None, fin
 
             report['status'].extend(('no_armature','unweighted'))
 
-
-    report['undeformable'] = {}
-    for v in obj.data.vertices:
-        deforming = 0
-        zero = 0  # :)
-        if len(v.groups) == 0:
-            report['unweighted'].append(v.index)
-        else:
-            for g in v.groups:
-                try:
-                    bonename = obj.vertex_groups[g.group].name
-                    if armature == None or (bonename in armature.data.bones and armature.data.bones[bonename].use_deform):
-                        deforming += 1 # count Number of deform bones for this vertex
-                        if g.weight <= minweight:
-                            zero += 1 # Count numberof zero weights for this vertex
-                    elif armature and (bonename in armature.data.bones and not armature.data.bones[bonename].use_deform):
-                        add_non_deforming_group(report['undeformable'] , bonename) 
-                except:
-
-                    pass
-                    
-            if deforming == 0:
-                report['unweighted'].append(v.index)
-            if deforming > max_weight:
-                report['too_many'].append(v.index)
-            if zero == deforming:
-
-                report['zero_weights'].append(v.index)
+    mask = get_deform_mask(obj, armature)
+    key = ('weight_report', armature.name if armature else None, tuple(mask), tuple(obj.vertex_groups.keys()), max_weight, minweight)
+    use_cache = use_cache and obj.mode != 'EDIT'
+    cache = util.get_mesh_cache(obj.data)
+    cached = cache.get(key) if use_cache else None
+    if cached is None:
+        cached = get_weight_problems(obj, mask, max_weight, minweight, use_cache=use_cache)
+        if use_cache:
+            cache[key] = cached
+
+    unweighted, zero_weights, too_many, undeformable = cached
+    report['unweighted'].extend(unweighted)
+    report['zero_weights'].extend(zero_weights)
+    report['too_many'].extend(too_many)
+    report['undeformable'] = dict(undeformable)
 
     if len(report['undeformable']) > 0:
         report['status'].append('undeformable')
@@ -1942,6 +1966,47 @@ def findWeightProblemVertices(context, obj, use_sl_list=True, armature=None, fin
     return report
 
 
+def get_weight_problems(obj, mask, max_weight, minweight, use_cache=False):
+    counts, groups, weights = get_weight_matrix(obj, use_cache=use_cache)
+    names = obj.vertex_groups.keys()
+    group_count = len(mask)
+
+    unweighted = []
+    zero_weights = []
+    too_many = []
+    undeformable_groups = {}
+
+    start = 0
+    for index, count in enumerate(counts):
+        if count == 0:
+            unweighted.append(index)
+            continue
+
+        end = start + count
+        deforming = 0
+        zero = 0  # :)
+        for i in range(start, end):
+            gi = groups[i]
+            state = mask[gi] if 0 <= gi < group_count else 0
+            if state == 1:
+                deforming += 1 # count Number of deform bones for this vertex
+                if weights[i] <= minweight:
+                    zero += 1 # Count numberof zero weights for this vertex
+            elif state == 2:
+                undeformable_groups[gi] = undeformable_groups.get(gi, 0) + 1
+        start = end
+
+        if deforming == 0:
+            unweighted.append(index)
+        if deforming > max_weight:
+            too_many.append(index)
+        if zero == deforming:
+            zero_weights.append(index)
+
+    undeformable = {names[gi]:count for gi, count in undeformable_groups.items()}
+    return unweighted, zero_weights, too_many, undeformable
+
+
 def findUnweightedVertices(context, obj, use_sl_list=True, arm=None):
 
 
@@ -1958,23 +2023,24 @@ def findUnweightedVertices(context, obj, use_sl_list=True, arm=None):
     excludes = []
     rig_sections = [B_EXTENDED_LAYER_ALL]
     
-    deform_bones = data.get_deform_bones(arm, rig_sections, excludes) if use_sl_list else []
-    
+    deform_bones = set(data.get_deform_bones(arm, rig_sections, excludes)) if use_sl_list else None
+    mask = get_deform_mask(obj, arm, deform_bones)
+    counts, groups, weights = get_weight_matrix(obj)
+    group_count = len(mask)
+
     status = WEIGHTS_OK
-    for v in obj.data.vertices:
+    start = 0
+    for index, count in enumerate(counts):
+        end = start + count
         tot = 0.0
-        for g in v.groups:
-            bonename = obj.vertex_groups[g.group].name
-
-            if bonename in arm.data.bones and arm.data.bones[bonename].use_deform:
-                if use_sl_list:
-                    if bonename in deform_bones:
-                        tot += g.weight
-                else:
-                    tot += g.weight
+        for i in range(start, end):
+            gi = groups[i]
+            if 0 <= gi < group_count and mask[gi] == 1:
+                tot += weights[i]
+        start = end
 
         if tot==0:
-            unweighted.append(v.index)
+            unweighted.append(index)
             status = MISSING_WEIGHTS
 
     return unweighted, status
@@ -4351,7 +4417,7 @@ class ButtonExportSLCollada(bpy.types.Operator):
                     if not 'avastar' in arm:
                         continue
 
-                    if util.use_sliders(context) and rig.need_rebinding(arm, [obj]):
+                    if util.use_sliders(context) and rig.need_rebinding(arm, [obj], use_cache=False):
                         msg = M009_outdated_reference % obj.name
                         help_page = get_help_page("REBIND_ARMATURE")
                         export_errors.append([msg, help_page])
@@ -5428,7 +5494,7 @@ def get_images_for_material(mat_images, material):
 
 def create_libimages(root, base, mat_images, exportCopy, preferred_image_format, force_image_format, useImageAlpha, warnings):
 
-    libimages = subx(root, 'library_images')
+    libimages = elemx('library_images')
     saved    = []
 
     original_color_mode = bpy.context.scene.render.image_settings.color_mode
@@ -5541,6 +5607,7 @@ def create_libimages(root, base, mat_images, exportCopy, preferred_image_format,
         image.file_format = original_format
         
     bpy.context.scene.render.image_settings.color_mode = original_color_mode
+    root.add(libimages)
     return libimages
     
 
@@ -5567,31 +5634,66 @@ def get_normal_index(n, normals, normalsd):
         nidx = add(normal)
     return nidx
 
+def get_collada_float_text(values, precision, stride, as_float32=True):
+    '''
+    Format a flat list of floats for a collada float_array.
+    Creates the same text as formatting each sanitized value
+    with "%g" (2 extra blanks after each row of stride values).
+    When as_float32 is set, the sanitized values are stored
+    as single precision first, just like a Vector does.
+    '''
+    values = [util.sanitize_f(f, precision) for f in values]
+    if as_float32:
+        values = array('f', values)
+    row = " ".join(["%g"]*stride) + "  "
+    return " ".join([row]*(len(values)//stride)) % tuple(values)
+
+def foreach_get_array(collection, attr, typecode, count):
+    values = array(typecode, [0]) * count
+    collection.foreach_get(attr, values)
+    return values
+
 def create_polylists(mesh, welded_normals, progress):
     dae_precision = util.get_precision()
     current_time = time.time()
     begin_time   = current_time
-    
-    def get_uv(uv_data, p, vidx, precision):
-        uv = uv_data[p.loop_indices[vidx]].uv
-        result = [util.sanitize_f(uv[0], precision),
-              util.sanitize_f(uv[1], precision)
-             ]
-        return result
 
     #
-
+    # Fetch all polygon and loop data in bulk
     #
-
     polygons = mesh.polygons
+    loops    = mesh.loops
+    pcount   = len(polygons)
+    lcount   = len(loops)
+
+    loop_starts  = foreach_get_array(polygons, 'loop_start', 'i', pcount)
+    loop_totals  = foreach_get_array(polygons, 'loop_total', 'i', pcount)
+    mat_indices  = foreach_get_array(polygons, 'material_index', 'i', pcount)
+    smooth_flags = foreach_get_array(polygons, 'use_smooth', 'b', pcount)
+    poly_normals = foreach_get_array(polygons, 'normal', 'f', 3*pcount)
+    loop_verts   = foreach_get_array(loops, 'vertex_index', 'i', lcount)
+    loop_normals = foreach_get_array(loops, 'normal', 'f', 3*lcount)
+
     uvexists = len(mesh.uv_layers)>0
     if uvexists:
-        uv_data = mesh.uv_layers.active.data
+        uv_data = foreach_get_array(mesh.uv_layers.active.data, 'uv', 'f', 2*lcount)
+        uv_data = [util.sanitize_f(f, dae_precision) for f in uv_data]
 
-            
-    polylists= {}
+    #
+    # Identical raw normals always map to the same normal index,
+    # so get_normal_index is only called once per distinct normal
+    #
     normals  = []
     normalsd = {}
+    rawnormalsd = {}
+    def normal_index(n):
+        nidx = rawnormalsd.get(n)
+        if nidx is None:
+            nidx = get_normal_index(n, normals, normalsd)
+            rawnormalsd[n] = nidx
+        return nidx
+
+    polylists= {}
     uv_array = []
     uvidx = 0
     
@@ -5600,16 +5702,14 @@ def create_polylists(mesh, welded_normals, progress):
     ps     = []
     lc     = 0    
     is_triangle = True
-    pcounter = 0
     
-    for p in polygons:
-        corner_count=len(p.vertices)
+    for pidx in range(pcount):
+        corner_count = loop_totals[pidx]
         is_triangle = is_triangle and corner_count==3
-        pcounter += 1
-        if pcounter % 1000 == 0:
+        if (pidx+1) % 1000 == 0:
             util.progress_update(1, absolute=False)            
 
-        mat_index = p.material_index
+        mat_index = mat_indices[pidx]
         if mat_index != last_mat_index:
 
             if last_mat_index != -1:
@@ -5633,47 +5733,27 @@ def create_polylists(mesh, welded_normals, progress):
 
         vcount.append(str(corner_count))
         lc += corner_count
-        
-        if p.use_smooth:
-
-            fixcount = 0
-            for vidx,v in enumerate(p.vertices):
-                x=0
-                if welded_normals and v in welded_normals:
-                    n = welded_normals[v]
-                    fixcount +=1
-                else:
-                    n = mesh.loops[p.loop_indices[vidx]].normal
-                
-                nidx = get_normal_index(n, normals, normalsd)
-                if uvexists:
-                    ps.extend((str(v),str(nidx),str(uvidx)+" "))
-                    
 
+        first = loop_starts[pidx]
+        if not smooth_flags[pidx]:
+            i = 3*pidx
+            nidx = normal_index(tuple(poly_normals[i:i+3]))
 
-                    uv = get_uv(uv_data, p, vidx, dae_precision)
-                    uv_array.extend(("%g"%uv[0], "%g  "%uv[1]))
-                    uvidx +=1
+        for li in range(first, first+corner_count):
+            v = loop_verts[li]
+            if smooth_flags[pidx]:
+                if welded_normals and v in welded_normals:
+                    nidx = normal_index(tuple(welded_normals[v]))
                 else:
-                    ps.extend((str(v),str(nidx)+" "))
-
-
-        else:
+                    i = 3*li
+                    nidx = normal_index(tuple(loop_normals[i:i+3]))
 
-            n = p.normal
-            nidx = get_normal_index(n, normals, normalsd)
-            
-            for vidx, v in enumerate(p.vertices):
-                if uvexists:
-                    ps.extend((str(v),str(nidx),str(uvidx)+" "))
-
-
-
-                    uv = get_uv(uv_data, p, vidx, dae_precision)
-                    uv_array.extend(("%g"%uv[0], "%g  "%uv[1]))
-                    uvidx +=1
-                else:
-                    ps.extend((str(v),str(nidx)+" "))
+            if uvexists:
+                ps.append("%d %d %d " % (v, nidx, uvidx))
+                uv_array.extend(uv_data[2*li:2*li+2])
+                uvidx +=1
+            else:
+                ps.append("%d %d " % (v, nidx))
                 
         ps.append("  ")
 
@@ -5716,6 +5796,34 @@ def add_material_list(tech, obj, uv_count):
             semantic = uv_layer.name
             subx(inst, "bind_vertex_input", semantic=semantic, input_semantic="TEXCOORD", input_set="0")
 
+def get_export_group_maps(meshobj, arm, export_bones, target_system):
+    '''
+    Resolve every vertex group of meshobj once:
+    export_groups maps the group index to the index of the exported bone,
+    ignored_names maps the group index to the name of a deforming bone
+    which is not part of the export
+    '''
+    export_groups = {}
+    ignored_names = {}
+    export_index  = {}
+    for index, bonename in enumerate(export_bones):
+        export_index.setdefault(bonename, index)
+
+    bones  = arm.data.bones
+    groups = meshobj.vertex_groups
+    for group in range(len(groups)):
+        bonename = const.get_export_bonename(groups, group, target_system)
+        if not bonename:
+            continue
+        b = bones.get(bonename)
+        if not (b and b.use_deform):
+            continue
+        if bonename in export_index:
+            export_groups[group] = export_index[bonename]
+        else:
+            ignored_names[group] = bonename
+    return export_groups, ignored_names
+
 def attachment_name(bone_name, with_structure=False):
     if with_structure:
         return bone_name.replace(" ", "_")
@@ -5943,11 +6051,9 @@ def exportCollada(context,
     #
 
     #
-    root = et.Element('COLLADA', attrib={'xmlns':'http://www.collada.org/2005/11/COLLADASchema', 'version':'1.4.1'})  
-    root.tail = os.linesep
-    xml = et.ElementTree(root)
+    root = ColladaSection('COLLADA', xmlns='http://www.collada.org/2005/11/COLLADASchema', version='1.4.1')
     
-    asset = subx(root, 'asset')
+    asset = elemx('asset')
 
     contributor = subx(asset, 'contributor')
     subx(contributor, 'author', text = "Avastar User")    
@@ -5961,9 +6067,10 @@ def exportCollada(context,
     subx(asset, 'modified', text=tstamp)    
     subx(asset, 'unit',     name='meter', meter='1')    
     subx(asset, 'up_axis',  text="Z_UP")    
+    root.add(asset)
     
-    subx(root, 'library_cameras')    
-    subx(root, 'library_lights')
+    root.add(elemx('library_cameras'))
+    root.add(elemx('library_lights'))
 
     if len(mat_images) > 0:
 
@@ -5977,13 +6084,13 @@ def exportCollada(context,
                                      useImageAlpha,
                                      complexity_warnings)
 
-    libeffects   = subx(root, 'library_effects')
-    libmaterials = subx(root, 'library_materials')
+    libeffects   = root.section('library_effects')
+    libmaterials = root.section('library_materials')
 
-    libgeo = subx(root, 'library_geometries')
-    libcon = subx(root, 'library_controllers')
-    libvis = subx(root, 'library_visual_scenes')
-    visual_scene = subx(libvis, 'visual_scene', id='Scene', name='Scene')   
+    libgeo = root.section('library_geometries')
+    libcon = root.section('library_controllers')
+    libvis = root.section('library_visual_scenes')
+    visual_scene = libvis.section('visual_scene', id='Scene', name='Scene')   
     arm_roots = {}
 
     active = context.object
@@ -5996,7 +6103,7 @@ def exportCollada(context,
     
         logging.debug("Export armature %s", arm.name)
         aid = colladaKey(arm.name)
-        node = subx(visual_scene, 'node', id=aid, name=aid, type='NODE')
+        node = elemx('node', id=aid, name=aid, type='NODE')
         subx(node, 'translate', sid='location', text='0 0 0')
         subx(node, 'rotate', sid='rotationZ', text='0 0 1 0')
         subx(node, 'rotate', sid='rotationY', text='0 1 0 0')
@@ -6014,6 +6121,7 @@ def exportCollada(context,
         Bones = data.get_reference_boneset(arm, arm.RigProp.RigType, export_joint_type)
 
         arm_roots[arm.name] = bonetoxml(arm, node, root_bone_name, apply_armature_scale, target_system, export_bone_set, rigstates, sceneProps, is_root=True, with_joints=with_joints, Bones=Bones)
+        visual_scene.add(node)
         util.ensure_mode_is(amode, context=context)
 
         print("+-----------------------------------------------")
@@ -6104,7 +6212,7 @@ def exportCollada(context,
 
         geometry_name = meshobj.name
         mid = colladaKey(meshobj.name)
-        geo = subx(libgeo, 'geometry', id=mid+'-mesh', name=geometry_name)
+        geo = elemx('geometry', id=mid+'-mesh', name=geometry_name)
         mx = subx(geo, 'mesh')
 
         #
@@ -6127,7 +6235,7 @@ def exportCollada(context,
             effect_id     = material_name+"-effect"
             material_id   = material_name+"-material"
             
-            effect = subx(libeffects, "effect", id=effect_id)
+            effect = elemx("effect", id=effect_id)
             prof = subx(effect, "profile_COMMON")
             
             images = get_images_for_material(mat_images, mat)
@@ -6210,25 +6318,22 @@ def exportCollada(context,
             wrap = subx(phong, "index_of_refraction")
             col = subx(wrap, "float", sid="index_of_refraction", text="1.0")
 
-            material = subx(libmaterials, "material", id=material_id, name=mat.name)
+            material = elemx("material", id=material_id, name=mat.name)
             subx(material, "instance_effect", url="#"+effect_id)
+            libeffects.add(effect)
+            libmaterials.add(material)
 
         #
 
         #
 
         source = subx(mx, 'source', id=mid+'-mesh-positions')
-        positions = []
-
-        for v in mesh_data_copy.vertices:
-            p = util.sanitize_v(v.co, dae_precision)
-            positions.append("%g"%p.x)
-            positions.append("%g"%p.y)
-            positions.append("%g  "%p.z)
+        vertices = mesh_data_copy.vertices
+        positions = foreach_get_array(vertices, 'co', 'f', 3*len(vertices))
             
         pos = subx(source, 'float_array', id=mid+'-mesh-positions-array', 
                    count=str(len(positions)))
-        pos.text = " ".join(positions)
+        pos.text = get_collada_float_text(positions, dae_precision, 3)
         
         tech = subx(source, 'technique_common')
         accessor = subx(tech, 'accessor', source='#'+mid+'-mesh-positions-array',
@@ -6254,17 +6359,12 @@ def exportCollada(context,
         #
         
 
-        normals_array = []        
-        for n in normals:
-            san = util.sanitize_v(n, dae_precision)
-            normals_array.append("%g"% san[0])
-            normals_array.append("%g"%san[1])
-            normals_array.append("%g  "%san[2])
+        normals_array = [f for n in normals for f in n]
                         
         source = subx(mx, 'source', id=mid+'-mesh-normals') 
         pos = subx(source, 'float_array', id=mid+'-mesh-normals-array',
                             count=str(len(normals_array))) 
-        pos.text = " ".join(normals_array)
+        pos.text = get_collada_float_text(normals_array, dae_precision, 3)
             
         tech = subx(source, 'technique_common')
         accessor = subx(tech, 'accessor', source='#'+mid+'-mesh-normals-array',
@@ -6281,7 +6381,7 @@ def exportCollada(context,
             source = subx(mx, 'source', id=mid+'-mesh-map-0') 
             pos = subx(source, 'float_array', id=mid+'-mesh-map-0-array',
                                 count=str(len(uv_array))) 
-            pos.text = " ".join(uv_array)
+            pos.text = get_collada_float_text(uv_array, None, 2, as_float32=False)
                 
             tech = subx(source, 'technique_common')
             accessor = subx(tech, 'accessor', source='#'+mid+'-mesh-map-0-array',
@@ -6339,8 +6439,9 @@ def exportCollada(context,
         extra = subx(geo, 'extra')
         tech = subx(extra, 'technique', profile='MAYA')
         subx(tech, 'double_sided', text='1')
+        libgeo.add(geo)
            
-        node = subx(visual_scene, 'node', id=mid, name=mid, type='NODE')
+        node = elemx('node', id=mid, name=mid, type='NODE')
         
         #
 
@@ -6350,7 +6451,7 @@ def exportCollada(context,
         if arm is not None:
             util.set_active_object(context, arm)
             aid = colladaKey(arm.name)
-            controler = subx(libcon, 'controller', name=aid, id=aid+"_"+mid+'-skin')
+            controler = elemx('controller', name=aid, id=aid+"_"+mid+'-skin')
             skin = subx(controler, 'skin', source='#'+mid+'-mesh')  
 
             bsm = rig.calculate_bind_shape_matrix(arm, meshobj)
@@ -6438,6 +6539,7 @@ def exportCollada(context,
             zero_weight_count = 0
             vcounter = 0
             ignored_groups = {}
+            export_groups, ignored_names = get_export_group_maps(meshobj, arm, export_bones, target_system)
             for v in mesh_data_copy.vertices:
                 vcounter += 1
                 if vcounter % 1000 == 0:
@@ -6446,21 +6548,13 @@ def exportCollada(context,
             
                 weights = []
                 for g in v.groups:
-
-                    bonename = const.get_export_bonename(meshobj.vertex_groups, g.group, target_system)
-                    if bonename and bonename in arm.data.bones:
-                        b = arm.data.bones[bonename]
-                        if b.use_deform:
-
-                            if bonename in export_bones:
-                                gidx = export_bones.index(bonename)
-                                weights.append([g.weight, gidx])
-                            else:
-                                count = ignored_groups.get(bonename)
-                                if count is None:
-                                    count = 0
-                                count += 1
-                                ignored_groups[bonename]=count
+                    gidx = export_groups.get(g.group)
+                    if gidx is not None:
+                        weights.append([g.weight, gidx])
+                    else:
+                        bonename = ignored_names.get(g.group)
+                        if bonename:
+                            ignored_groups[bonename] = ignored_groups.get(bonename, 0) + 1
 
 
                 weights.sort(key=lambda x: x[0], reverse=True)
@@ -6485,8 +6579,7 @@ def exportCollada(context,
                     widx = len(ws)
                     w = util.sanitize_f(weight, dae_precision)
                     ws.append("%g"%w)
-                    vs.append(str(group)) 
-                    vs.append(str(widx)+" ")
+                    vs.append("%d %d " % (group, widx))
                 vs.append(" ")
                 vcount.append(str(len(weights)))
             
@@ -6527,6 +6620,7 @@ def exportCollada(context,
                                     offset='1') 
             subx(vweights, 'vcount', text=" ".join(vcount))
             subx(vweights, 'v', text=" ".join(vs))
+            libcon.add(controler)
             
             #
 
@@ -6594,20 +6688,20 @@ def exportCollada(context,
                 add_material_list(tech, meshobj, len(uv_array) )
 
 
+        visual_scene.add(node)
         bpy.data.meshes.remove(mesh_data_copy)
 
     if with_appearance:
         for armobj in armatures:
             restore_armature_after_export(armobj)
 
-    scene = subx(root, 'scene')
+    scene = elemx('scene')
     subx(scene, 'instance_visual_scene', url='#Scene')
-
-    indentxml(root)
+    root.add(scene)
 
     status = False
     try:
-        xml.write(path, xml_declaration=True, encoding="utf-8")
+        root.write(path)
         logging.info("Exported model to: %s", path)
         status = True
         if sceneProps.collada_export_shape:
@@ -6642,6 +6736,69 @@ def subx(parent, tag, **attrib):
         sub.text = attrib['text']
     return sub    
 
+def elemx(tag, **attrib):
+    attrib2 = {}
+    for key,value in attrib.items():
+        if key!='text':
+            attrib2[key]=value
+    elem = et.Element(tag, attrib=attrib2)
+    if 'text' in attrib:
+        elem.text = attrib['text']
+    return elem
+
+class ColladaSection:
+    '''
+    A container element of the exported collada document.
+    Finished child elements are indented and serialized as soon
+    as they are added, then only their text is kept (in a temporary
+    file), so the document never exists as one complete ElementTree.
+    write() assembles the sections into the same text that
+    indentxml() followed by ElementTree.write() would produce.
+    '''
+
+    def __init__(self, tag, level=0, **attrib):
+        self.elem  = elemx(tag, **attrib)
+        self.level = level
+        self.parts = []
+
+    def section(self, tag, **attrib):
+        child = ColladaSection(tag, self.level+1, **attrib)
+        self.parts.append(child)
+        return child
+
+    def add(self, elem):
+        level = self.level+1
+        indentxml(elem, level)
+        elem.tail = None
+        text = "\n" + level*"  " + et.tostring(elem, encoding="unicode")
+
+        if not self.parts or isinstance(self.parts[-1], ColladaSection):
+            self.parts.append(tempfile.TemporaryFile())
+        self.parts[-1].write(text.encode("utf-8"))
+
+    def write_to(self, f):
+        tag = et.tostring(self.elem, encoding="unicode")
+        if not self.parts:
+            f.write(tag.encode("utf-8"))
+            return
+
+        f.write((tag[:-3] + ">").encode("utf-8"))
+        for part in self.parts:
+            if isinstance(part, ColladaSection):
+                f.write(("\n" + (self.level+1)*"  ").encode("utf-8"))
+                part.write_to(f)
+            else:
+                part.seek(0)
+                shutil.copyfileobj(part, f)
+                part.close()
+        f.write(("\n" + self.level*"  " + "</%s>" % self.elem.tag).encode("utf-8"))
+
+    def write(self, path):
+        with open(path, 'wb') as f:
+            f.write("<?xml version='1.0' encoding='utf-8'?>\n".encode("utf-8"))
+            self.write_to(f)
+            f.write(os.linesep.encode("utf-8"))
+
 def bonetoxml(arm, parent, bonename, apply_armature_scale, target_system, export_bone_set, rigstates, sceneProps, is_root=False, with_joints=False, Bones=None):
     dae_precision = util.get_precision()
 
@@ -6844,18 +7001,44 @@ class ClosestPoint:
         return self.source_co
 
 class KDTreeSet:
+    '''
+    Nearest vertex queries over the world space vertices of a set
+    of mesh objects. The balanced tree of each object is kept in the
+    mesh cache (dropped when the mesh changes) together with the
+    object transform it was built for, so it is only rebuilt when
+    the object has been edited or moved.
+    '''
 
-    trees = {}
+    def __init__(self):
+        self.trees = []
 
     def add(self, obj):
-        mesh = obj.data
-        size = len(mesh.vertices)
-        kd = KDTree(size)
-        for i, v in enumerate(mesh.vertices):
-            co = mulmat(obj.matrix_world, v.co)
-            kd.insert(co, i)
+        self.trees.append((obj, self.get_tree(obj)))
+
+    @staticmethod
+    def get_tree(obj):
+        M = obj.matrix_world
+        verts = obj.data.vertices
+        stamp = (len(verts), tuple(tuple(row) for row in M))
+        cache = util.get_mesh_cache(obj.data)
+        key = ('kdtree', obj.name)
+        entry = cache.get(key)
+        if entry and entry[0] == stamp:
+            return entry[1]
+
+        co = array('f', [0.0]) * (3*len(verts))
+        verts.foreach_get('co', co)
+        x, y, z = co[0::3], co[1::3], co[2::3]
+        for axis in range(3):
+            a, b, c, d = M[axis]
+            co[axis::3] = array('f', [a*vx + b*vy + c*vz + d for vx, vy, vz in zip(x, y, z)])
+
+        kd = KDTree(len(verts))
+        for i in range(len(verts)):
+            kd.insert(co[3*i:3*i+3], i)
         kd.balance()
-        self.trees[obj] = kd
+        cache[key] = (stamp, kd)
+        return kd
 
     def find(self, refco):
 
@@ -6864,10 +7047,10 @@ class KDTreeSet:
         index = None
         distance = None
 
-        for ob, kd in self.trees.items():
+        for ob, kd in self.trees:
 
             _loc, _index, _distance = kd.find(refco)
-            if distance == None or distance > _distance:
+            if _index is not None and (distance == None or distance > _distance):
                 distance = _distance
                 index = _index
                 loc = _loc
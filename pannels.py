@@ -1865,7 +1865,7 @@ def analyseMeshes(context, targets):
 
         #
 
-        v_report = mesh.findWeightProblemVertices(context, obj, use_sl_list=False, find_selected_armature=True)
+        v_report = mesh.findWeightProblemVertices(context, obj, use_sl_list=False, find_selected_armature=True, use_cache=True)
         
         if 'no_armature' in v_report['status']:
             report.append("\tObject %s is not rigged (weight map check omitted)"%obj.name)
@@ -2404,13 +2404,18 @@ class PanelMeshInfo(bpy.types.Panel):
 
 
             need_update = False
+            computing = False
             stat_info = init_mesh_info_panel(context)
             weightmaps_per_meshobj = {}
             if stat_info != None:
 
                 for meshobj in targets:
                     if context.scene.MeshProp.auto_refresh_mesh_stat:
-                        stats = util.create_mesh_stats(context.scene, meshobj)
+                        stats = util.get_mesh_stats(meshobj)
+                        if stats is None:
+                            util.request_mesh_stats(meshobj)
+                            stats = meshobj.get(MESH_STATS)
+                            computing = computing or not stats
                     else:
                         stats = meshobj.get(MESH_STATS)
 
@@ -2459,6 +2464,8 @@ class PanelMeshInfo(bpy.types.Panel):
             row.prop(context.scene.MeshProp, "auto_refresh_mesh_stat", text='', icon=ICON_AUTO)
 
             if need_update:
+                if computing:
+                    col.label(text="Computing mesh statistics ...", icon=ICON_INFO)
                 return
 
             col = box.column(align=True)
@@ -22,6 +22,7 @@
 # ##### END GPL LICENSE BLOCK #####
 
 import bpy, os, logging, traceback, re
+from array import array
 from bpy.props import *
 from bpy.app.handlers import persistent
 
@@ -1857,56 +1858,79 @@ class AvastarFaceWeightGenerator(bpy.types.Operator):
 
         return{'FINISHED'}
 
+def get_island_labels(ob):
+    '''
+    Return a per vertex array of island labels and the island sizes.
+    Islands are numbered in the order of their first polygon,
+    vertices which belong to no polygon are labeled -1.
+    '''
+
+    me = ob.data
+    vcount = len(me.vertices)
+    loop_vertices = array('i', [0]) * len(me.loops)
+    loop_starts   = array('i', [0]) * len(me.polygons)
+    loop_totals   = array('i', [0]) * len(me.polygons)
+    me.loops.foreach_get('vertex_index', loop_vertices)
+    me.polygons.foreach_get('loop_start', loop_starts)
+    me.polygons.foreach_get('loop_total', loop_totals)
+
+    parent = array('i', range(vcount))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for start, total in zip(loop_starts, loop_totals):
+        root = find(loop_vertices[start])
+        for vi in loop_vertices[start+1:start+total]:
+            other = find(vi)
+            if other != root:
+                parent[other] = root
+
+    labels = array('i', [-1]) * vcount
+    root_labels = {}
+    for start in loop_starts:
+        root = find(loop_vertices[start])
+        if root not in root_labels:
+            root_labels[root] = len(root_labels)
+
+    sizes = [0] * len(root_labels)
+    for vi in set(loop_vertices):
+        label = root_labels[find(vi)]
+        labels[vi] = label
+        sizes[label] += 1
+
+    return labels, sizes
+
 def get_islands(ob, minsize=1):
-    island_id    = 0
-    island_map   = {}
-    islands      = {}
-
-    def merge_islands(parts):
-        iterparts = iter(parts)
-        first= next(iterparts)
-        for part in iterparts:
-            src  = islands[part]
-            islands[first].update(src)
-            for key in src:
-                island_map[key] = first
-            islands[part].clear()
-        return first
-
-    for poly in ob.data.polygons:
-        parts = sorted({island_map[index] for index in poly.vertices if index in island_map})
-
-        if len(parts) > 0:
-            id = merge_islands(parts)
-        else:
-            id = island_id
-            islands[id] = {}
-            island_id  += 1
-
-        island = islands[id]
-        for vert in poly.vertices:
-            island_map[vert] = id
-            island[vert]=True
-            
-    return [island for island in islands.values() if len(island) >= minsize]
+    labels, sizes = get_island_labels(ob)
+    islands = [{} for size in sizes]
+    for vi, label in enumerate(labels):
+        if label > -1:
+            islands[label][vi] = True
+    return [island for island in islands if len(island) >= minsize]
 
 def select_island(ob, minsize=1):
     bpy.ops.mesh.select_all(action='DESELECT')
     bpy.ops.mesh.reveal()
     ob.update_from_editmode()
     
-    islands = get_islands(ob, minsize)
-    active_island = None
-    for island in islands:
-        if (active_island == None or len(island) > len(active_island)) and len(island) >= minsize:
-            active_island = island
-
-    if active_island:
-        log.info("Found island of size %d" % len(active_island))
-        util.mode_set(mode='OBJECT')
-        for index in active_island:
-            ob.data.vertices[index].select = True
-        util.mode_set(mode='EDIT')
+    labels, sizes = get_island_labels(ob)
+    active_label = None
+    for label, size in enumerate(sizes):
+        if (active_label == None or size > sizes[active_label]) and size >= minsize:
+            active_label = label
+
+    if active_label is None:
+        return None
+
+    active_island = {vi for vi, label in enumerate(labels) if label == active_label}
+    log.info("Found island of size %d" % len(active_island))
+    util.mode_set(mode='OBJECT')
+    ob.data.vertices.foreach_set('select', [label == active_label for label in labels])
+    util.mode_set(mode='EDIT')
     return active_island
 
 def convert_weight_groups(armobj, obj, armature_type=SLMAP):
@@ -2467,26 +2491,70 @@ def apply_ik_orientation(context, armature, apply_all=False, target=None):
 
 
 
-def copy_pose_from_armature(context, srcarm, tgtarm, all=True, use_bonemap=False):
+def set_pose_matrices(context, armobj, matrices, use_scale=True):
+    '''
+    Assign the pose matrices in matrices (bone name -> pose matrix)
+    like setting pbone.matrix for each bone, parent first. The basis
+    matrices are computed from the new parent pose matrices, so the pose
+    does not need to be re-evaluated after each bone. Constraints
+    are not part of that computation, so when a parent with active
+    constraints has changed, the pose is evaluated once before the
+    next hierarchy level is set.
+    '''
 
-    def matches_filter(name,filter):
-        if filter:
-            for key in filter:
-                if key in name:
-                    return True
-        return False
+    def has_active_constraints(pbone):
+        return any(not c.mute and c.influence > 0 for c in pbone.constraints)
+
+    pbones = armobj.pose.bones
+    depth  = {}
+    levels = []
+    for name in bones_in_hierarchical_order(armobj):
+        dparent = pbones[name].bone.parent
+        lvl = depth[dparent.name] + 1 if dparent else 0
+        depth[name] = lvl
+        if lvl == len(levels):
+            levels.append([])
+        levels[lvl].append(name)
+
+    POSE = {}
+    for level in levels:
+        if any(pbones[name].parent.name in POSE and has_active_constraints(pbones[name].parent)
+               for name in level if pbones[name].parent):
+            context.view_layer.update()
+            POSE.clear()
+
+        for name in level:
+            pbone   = pbones[name]
+            dbone   = pbone.bone
+            dparent = dbone.parent
+            matrix  = matrices.get(name)
+            if matrix is None and not (dparent and dparent.name in POSE):
+                continue
+
+            if dparent:
+                parent_matrix = POSE.get(dparent.name, pbone.parent.matrix)
+                parent_matrix_local = dparent.matrix_local
+            else:
+                parent_matrix = Matrix()
+                parent_matrix_local = Matrix()
+
+            if matrix is not None:
+                basis = dbone.convert_local_to_pose(matrix, dbone.matrix_local,
+                            parent_matrix=parent_matrix,
+                            parent_matrix_local=parent_matrix_local,
+                            invert=True)
+                if not use_scale:
+                    loc, rot, scale = basis.decompose()
+                    basis = mulmat(Matrix.Translation(loc), rot.to_matrix().to_4x4())
+                pbone.matrix_basis = basis
+
+            POSE[name] = dbone.convert_local_to_pose(pbone.matrix_basis, dbone.matrix_local,
+                            parent_matrix=parent_matrix,
+                            parent_matrix_local=parent_matrix_local)
 
-    def bones_in_hierarchical_order(arm, roots=None, bone_names=None, filter=None):
-        if not bone_names:
-            bone_names = []
-        if not roots:
-            roots = [b for b in arm.data.bones if b.parent == None]
-        for root in [n for n in roots]:
-            if not matches_filter(root.name, filter):
-                bone_names.append(root.name)
-            if root.children:
-                bones_in_hierarchical_order(arm, root.children, bone_names, filter=filter)
-        return bone_names
+    context.view_layer.update()
+
+def copy_pose_from_armature(context, srcarm, tgtarm, all=True, use_bonemap=False):
 
     active = util.get_active_object(context)
     util.set_active_object(context, tgtarm)
@@ -2499,27 +2567,21 @@ def copy_pose_from_armature(context, srcarm, tgtarm, all=True, use_bonemap=False
     bonemap = bpy.context.scene.MocapProp if use_bonemap else None
     
     MSW  = srcarm.matrix_world
-    MSWI = MSW.inverted()
-    MTW  = tgtarm.matrix_world
-    MTWI = MTW.inverted()
     SCA  = MSW.to_scale()
     S = matrixScale(SCA)
-    
+
+    matrices = {}
     for name in names:
         tgt = tgt_bones[name]
         source_name = bonemap.get(name) if bonemap else name
         if not source_name:
-
             continue
 
         src = src_bones.get(source_name,None)
         if src and (tgt.bone.select or all):
-            M = src.matrix
-            tgt.matrix = mulmat(S, M)
-            tgt.scale = (1,1,1)
-            util.mode_set(mode='OBJECT')
-            util.mode_set(mode='POSE')
+            matrices[name] = mulmat(S, src.matrix)
 
+    set_pose_matrices(context, tgtarm, matrices, use_scale=False)
     util.set_active_object(context, active)
 
 class FocusOnBone(bpy.types.Operator):
@@ -2749,11 +2811,7 @@ def armatureFromMocap(context, target, mocap, with_mbones=True, source_ref_pose=
 
     bone_names = bones_in_hierarchical_order(target, roots=None, bone_names=None, filter=['ik'])
     pbones  = target.pose.bones
-
-
-
-
-
+    matrices = {}
 
     for bname in bone_names:
         if bname in SLVOLBONES:
@@ -2764,8 +2822,9 @@ def armatureFromMocap(context, target, mocap, with_mbones=True, source_ref_pose=
         tpbone = pbones.get(bname, None)
         matrix, changed = retargetPoseBone(context, tpbone, source, mocap, source_ref_pose, target_ref_pose)
         if changed:
-            tpbone.matrix = matrix
-            util.update_depsgraph(context) # need this to recalculate internal matrices of all pose bones
+            matrices[bname] = matrix
+
+    set_pose_matrices(context, target, matrices)
 
     tpbone = pbones.get('COG', None)
     if tpbone and refloc:
@@ -3798,24 +3857,64 @@ def get_custom_bindposition(armobj, dbone, use_cache=True, with_joint_offset=Tru
 
     return  pos, tail
 
+#
+# Process local cache for computed bone positions.
+# The cache is keyed by the armature data pointer, the
+# item name (bone name or armature object name) and the cache kind.
+# Each armature entry remembers the armature name and the
+# cache generation of the armature at the time it was filled.
+# The generation is an ID property of the armature, so it
+# follows undo/redo and is bumped on every joint or slider edit.
+# Entries with a different name or generation are stale.
+# It is never stored in the blend file.
+#
+ITEM_CACHE = {}
+CACHE_GENERATION = 'cache_generation'
+
+def get_item_cache_armature(item):
+    owner = item.id_data
+    if owner.bl_rna.identifier == 'Object':
+        owner = owner.data
+    return owner
+
+def get_item_cache_owner(item):
+    return get_item_cache_armature(item).as_pointer()
+
+def get_cache_generation(arm):
+    return arm.get(CACHE_GENERATION, 0)
+
+def bump_cache_generation(arm):
+    arm[CACHE_GENERATION] = get_cache_generation(arm) + 1
+
+def get_armature_cache(item, create=False):
+    arm = get_item_cache_armature(item)
+    stamp = (arm.name, get_cache_generation(arm))
+    pointer = arm.as_pointer()
+    cache = ITEM_CACHE.get(pointer)
+    if cache and cache['stamp'] != stamp:
+        del ITEM_CACHE[pointer]
+        cache = None
+    if cache is None and create:
+        cache = ITEM_CACHE[pointer] = {'stamp':stamp}
+    return cache
+
 def get_item_cache(item, key):
-    cache = item.get('cache', None)
+    cache = get_armature_cache(item)
     if not cache:
         return None
 
-    val = cache.get(key, None)
+    val = cache.get((item.name, key), None)
     return val
 
 def set_item_cache(item, key, val):
-    cache = item.get('cache', None)
-    if cache == None:
-        cache = {}
-
-    cache[key] = val
-    item['cache'] = cache
+    cache = get_armature_cache(item, create=True)
+    cache[(item.name, key)] = [Vector(v) for v in val]
 
 def reset_item_cache(item, full=False):
-    util.remove_key(item, 'cache')
+    cache = get_armature_cache(item)
+    if cache:
+        for key in ['slr', 'cur', 'slbr', 'cubr', 'floor']:
+            cache.pop((item.name, key), None)
     if full:
         util.remove_key(item, 'fix_head')
         util.remove_key(item, 'fix_tail')
@@ -3823,11 +3922,20 @@ def reset_item_cache(item, full=False):
 def reset_cache(armobj, subset=None, full=False):
     log_cache.debug("Reset %s Cache" % armobj.name)
     if subset == None:
-        subset = util.get_modify_bones(armobj)
-    for dbone in subset:
-        reset_item_cache(dbone, full)
+        bump_cache_generation(armobj.data)
+        ITEM_CACHE.pop(get_item_cache_owner(armobj), None)
+        if full:
+            for dbone in util.get_modify_bones(armobj):
+                reset_item_cache(dbone, full)
+    else:
+        for dbone in subset:
+            reset_item_cache(dbone, full)
     reset_item_cache(armobj, full)
 
+@persistent
+def clear_item_cache(dummy):
+    ITEM_CACHE.clear()
+
 
 
 
@@ -4774,17 +4882,17 @@ def get_bone_count(meshobj, armobj):
     bones = armobj.data.bones
     return len([v for v in meshobj.vertex_groups if v.name in bones and bones[v.name].use_deform])
 
-def need_rebinding(armobj, meshes):
+def need_rebinding(armobj, meshes, use_cache=True):
     to_fix=[]
     for ob in meshes:
         object_rev = ob.get('version', 0)
         checksum = ob.get(CHECKSUM)
         if object_rev < 20420 or DIRTY_MESH in ob:
-            if checksum != util.calc_object_checksum(ob):
+            if not util.object_checksum_matches(ob, checksum, use_cache=use_cache):
                 to_fix.append(ob)
                 continue
 
-            if checksum != util.calc_object_checksum(ob):
+            if not util.object_checksum_matches(ob, checksum):
                 to_fix.append(ob)
         elif not util.is_child_of(armobj, ob):
             to_fix.append(ob)
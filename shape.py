@@ -617,6 +617,15 @@ def createShapeDrivers(DRIVERS):
 
 
 def createMeshShapes(MESHES):
+    MESHSHAPES, sources = data.load_cache("meshshapes")
+    if MESHSHAPES is None or sources != data.MESH_SOURCES or set(MESHSHAPES) != set(MESHES):
+        MESHSHAPES = createMeshShapesFromMeshes(MESHES)
+        if data.MESH_SOURCES:
+            data.save_cache("meshshapes", MESHSHAPES, data.MESH_SOURCES)
+
+    ShapeDrivers.MESHSHAPES = MESHSHAPES
+
+def createMeshShapesFromMeshes(MESHES):
 
 
 
@@ -646,38 +655,49 @@ def createMeshShapes(MESHES):
 
 
 
+        #
+        # Per bone the morph is stored as a packed pair:
+        # vertex indices (uint) and the weighted deltas w*dv (3 floats per index)
+        #
         SHAPE_KEYS= {}
         for pid, morph in mesh['morphs'].items():
             util.progress_update(1, False)
 
             DVS = {} 
-            for v in morph['vertices']:
-                ii = v['vertexIndex']
+            morph_coords = morph['coordArray']
+            for n, ii in enumerate(morph['indexArray']):
                 if ii in mesh['vertexRemap']:
                     continue
-                dv = v['coord']
-                DVS[data.getVertexIndex(mesh, ii)] = dv
+                DVS[data.getVertexIndex(mesh, ii)] = morph_coords[3*n:3*n+3]
 
             BONEGROUPS={}
             dvset = set(DVS)
             for bone, weights in WEIGHTS.items():
-                IWDVs = []
-                for vid in dvset.intersection(weights):
-                    IWDVs.append( (vid, WEIGHTS[bone][vid], DVS[vid]) )
-                BONEGROUPS[bone] = IWDVs
+                vids = sorted(dvset.intersection(weights))
+                if not vids:
+                    continue
+
+                deltas = array.array('f')
+                for vid in vids:
+                    w = weights[vid]
+                    dv = DVS[vid]
+                    deltas.extend((w*dv[0], w*dv[1], w*dv[2]))
+                BONEGROUPS[bone] = (array.array('I', vids), deltas)
 
             SHAPE_KEYS[pid] = BONEGROUPS
         MESH['shapekeys'] = SHAPE_KEYS
 
 
 
-        verts = [mesh['baseCoords'][i] for i in mesh['vertLookup']]
-        co = [item for sublist in verts for item in sublist]
+        coords = mesh['coordArray']
+        co = array.array('f')
+        for i in mesh['vertLookup']:
+            co.extend(coords[3*i:3*i+3])
         MESH['co'] = co
 
         MESHSHAPES[meshname]=MESH
     
-    ShapeDrivers.MESHSHAPES = MESHSHAPES
+    return MESHSHAPES
 
 def initialize(rigType):
     log.debug("Loading Avastar Shape Interface for rigType %s" % (rigType))
@@ -1272,8 +1292,9 @@ def update_system_shapekey(armobj, bones, meshobj, MESH, hover, mesh_weights, bo
 
     shapekey_items = MESH['shapekeys'].items()
 
-    dco = create_reference_shape(co, armobj, bones, meshobj, mesh_weights)
-    dco = [f - hover.z if (i+1)%3==0 else f for i,f in enumerate(dco)]
+    dco = array.array('f', create_reference_shape(co, armobj, bones, meshobj, mesh_weights))
+    hz = hover.z
+    dco[2::3] = array.array('f', [f - hz for f in dco[2::3]])
 
     keyblocks = meshobj.data.shape_keys.key_blocks
     keyblocks[0].data.foreach_set('co',dco)
@@ -1283,26 +1304,24 @@ def update_system_shapekey(armobj, bones, meshobj, MESH, hover, mesh_weights, bo
         if len(sk_items) == 0:
             continue
 
-        co2 = dco.copy()
+        co2 = array.array('f', dco)
         if type(sk_items) is list:
             for vi, val in enumerate(sk_items):
                 co2[vi]   += sk_items[vi]
         else:
-            for bname, IWDVs in sk_items:
+            for bname, (indices, deltas) in sk_items:
 
-                if len(IWDVs) == 0:
+                sx, sy, sz = get_bone_scale_from_cache(bone_scales, bones, bname)
+                if sx == 0 and sy == 0 and sz == 0:
                     continue
 
-                scale = get_bone_scale_from_cache(bone_scales, bones, bname)
-                for vi,w,dv in IWDVs:
-
-                    x=3*vi
-                    y=x+1
-                    z=x+2
-
-                    co2[x] += w*dv[0]*scale[0]
-                    co2[y] += w*dv[1]*scale[1]
-                    co2[z] += w*dv[2]*scale[2]
+                d = 0
+                for vi in indices:
+                    x = 3*vi
+                    co2[x]   += deltas[d]   * sx
+                    co2[x+1] += deltas[d+1] * sy
+                    co2[x+2] += deltas[d+2] * sz
+                    d += 3
 
         try:
             keyblocks[pid].data.foreach_set('co',co2)
@@ -2587,7 +2606,6 @@ def update_shape_from_weightmaps(weightmaps, weighted_verts, armobj, child, init
         co[i] += hover
 
     fco = co.copy()
-    precos = get_precos(child, co, use_cache=False) 
 
 
 
@@ -2600,7 +2618,7 @@ def update_shape_from_weightmaps(weightmaps, weighted_verts, armobj, child, init
 
     for bname, weights in weightmaps.values():
         if weights:
-            calculate_shape_delta(armobj, child, bname, weights, co, fco, init, precos, use_cache=True)
+            calculate_shape_delta(armobj, child, bname, weights, co, fco, init, use_cache=True)
 
     hover = hobj[2] + height[2]
     for i in range(2,len(fco),3):
@@ -2729,20 +2747,6 @@ def get_global_store(store_name):
     return store
 
 
-def get_precos(child, co, use_cache=True):
-    if use_cache:
-        precos_store = get_global_store('precos_store')
-        precos = precos_store.get(child.name)
-
-    if use_cache==False or precos==None:
-        precos = precalc_vertex_data(child, co)
-
-    if use_cache:
-        precos_store[child.name] = precos
-
-    return precos
-
-
 def reset_armature_weight_groups(context, armobj):
     custom_object_map = animated_custom_objects(context, armobj)
     for obj in custom_object_map.values():
@@ -2828,48 +2832,54 @@ def precalc_vertex_data(child, co):
 
 
 
-def calculate_shape_delta(armobj, child, bname, weights, co, dco, init, precos, use_cache=True):
-    
-
-
-
-
-
+def get_shape_delta_transform(armobj, child, bname, init, use_cache=True):
+    '''
+    Return the shape delta of bone bname as an affine map
+    (3 rows of 4 floats) applied to the local vertex coordinates.
+    The map combines the object matrix, the bone scale and the
+    bone locations into one matrix so that the delta of a vertex
+    is just: weight * (M @ co)
+    '''
     BoneLoc0, BoneLoc, MScaleLocal = calculate_shape_transform(armobj, child, bname, init=init, use_binding=True, use_cache=use_cache)
     if not BoneLoc0:
-        return
-    
-    bones = util.get_modify_bones(armobj)
-    dbone = bones.get(bname, None)
+        return None
 
-    coflen = len(co)
     MChild  = child.matrix_local
-    MChildI = MChild.inverted()
     has_bone_rotation = util.is_rotation_matrix(MScaleLocal)
     has_bone_scale = not util.is_unity_matrix(MScaleLocal, has_bone_rotation)
     has_object_rotation = util.is_rotation_matrix(MChild)
     has_object_scale = not util.is_unity_matrix(MChild, has_object_rotation)
 
-    for index, weight in weights:
+    M = mulmat(Matrix.Translation(-BoneLoc0), MChild)
+    if has_bone_scale:
+        M = mulmat(MScaleLocal, M)
+    M = mulmat(Matrix.Translation(BoneLoc), M)
+    if has_object_scale:
+        M = mulmat(MChild.inverted(), M)
 
-        dco_index = get_dco_index(index, coflen, child)
-        if dco_index == None:
-            continue
+    return [[M[r][c] - (1.0 if r == c else 0.0) for c in range(4)] for r in range(3)]
 
-        vert_local_co, vert_world_co = get_preco_verts(precos, index)
-        if vert_local_co == None or vert_world_co == None:
-            continue
 
-        delta_world = vert_world_co - BoneLoc0
-        if has_bone_scale:
-            delta_world = MScaleLocal @ delta_world
+def calculate_shape_delta(armobj, child, bname, weights, co, dco, init, use_cache=True):
+    M = get_shape_delta_transform(armobj, child, bname, init, use_cache=use_cache)
+    if not M:
+        return
 
-        shape_local_co = delta_world + BoneLoc
-        if has_object_scale:
-            shape_local_co = MChildI @ shape_local_co
+    (a00, a01, a02, a03), (a10, a11, a12, a13), (a20, a21, a22, a23) = M
+    coflen = len(co)
 
-        DL = weight * (shape_local_co - vert_local_co)
-        update_shape_delta(dco_index, dco, DL)
+    for index, weight in weights:
+        i = 3*index
+        if i < 0 or i+3 > coflen:
+            get_dco_index(index, coflen, child)
+            continue
+
+        x = co[i]
+        y = co[i+1]
+        z = co[i+2]
+        dco[i]   += weight * (a00*x + a01*y + a02*z + a03)
+        dco[i+1] += weight * (a10*x + a11*y + a12*z + a13)
+        dco[i+2] += weight * (a20*x + a21*y + a22*z + a23)
 
     return
 
@@ -2895,29 +2905,6 @@ def get_dco_index(index, coflen, child):
     return dco_index
 
 
-def get_preco_verts(precos, index):
-    maxi = len(precos)
-    if index >= maxi:
-        return None,None
-    if index < 0:
-        return None, None
-
-    return precos[index]
-
-
-def get_world_delta(vert_world_co, BoneLoc0, MScaleLocal, has_bone_scale):
-    d = vert_world_co-BoneLoc0
-    if has_bone_scale:
-        d = MScaleLocal @ d
-    return d
-
-def get_shape_local(d, BoneLoc, MChildI, has_object_scale):
-    shape_local = d + BoneLoc
-    if has_object_scale:
-        shape_local = MChildI @ shape_local
-    return shape_local
-
-
 def update_shape_delta(offset, dco, DL):
     dco[offset]    += DL[0]
     dco[offset+1]  += DL[1]
@@ -3240,6 +3227,26 @@ def adjust_slider_meta_data(armobj, bones, D, v):
                 bone['offset'] = offset
 
 
+IGNORED_DRIVEN_PIDS = {
+    'eyeball_size_679',
+    'eyeball_size_680',
+    'eyeball_size_681',
+    'eyeball_size_687',
+    'eyeball_size_688',
+    'eyeball_size_691',
+    'eyeball_size_694',
+    'eyeball_size_695',
+}
+
+SILENT_MISSING_PIDS = {
+    "pants_length_shadow_915",
+    "pants_length_cloth_615",
+    "pants_length_cloth_1018",
+    "pants_length_cloth_1036",
+    "lower_clothes_shading_913",
+    "upper_clothes_shading_899",
+}
+
 def expandDrivenKeys(armobj, D, v, meshchanges, bonechanges):
     '''
     Expand from driver that controls other drivers
@@ -3262,16 +3269,7 @@ def expandDrivenKeys(armobj, D, v, meshchanges, bonechanges):
     for DR in D['driven']:
         drpid = DR['pid'] 
 
-        if drpid in [
-                    'eyeball_size_679',
-                    'eyeball_size_680',
-                    'eyeball_size_681',
-                    'eyeball_size_687',
-                    'eyeball_size_688',
-                    'eyeball_size_691',
-                    'eyeball_size_694',
-                    'eyeball_size_695',
-                    ]:
+        if drpid in IGNORED_DRIVEN_PIDS:
 
             continue
 
@@ -3309,7 +3307,7 @@ def expandDrivenKeys(armobj, D, v, meshchanges, bonechanges):
         try:
             D2s = armobj.ShapeDrivers.DRIVERS[drpid]
         except KeyError:
-            if drpid not in ["pants_length_shadow_915","pants_length_cloth_615","pants_length_cloth_1018","pants_length_cloth_1036","lower_clothes_shading_913","upper_clothes_shading_899"]:
+            if drpid not in SILENT_MISSING_PIDS:
 
                 logging.warn("Missing driver: %s", drpid)
             continue
@@ -24,6 +24,7 @@
 # ##### END GPL LICENSE BLOCK #####
 
 from collections import namedtuple
+from itertools import compress
 import logging, traceback
 import bpy, sys, os, gettext
 from math import radians, sqrt, pi
@@ -33,9 +34,11 @@ from bpy.app.handlers import persistent
 from bpy.props import *
 from . import bl_info, const, messages
 from .const import *
-import time, shutil, io
+import time, shutil, io, hashlib
+from array import array
 
 from mathutils import geometry
+from mathutils.kdtree import KDTree
 
 LOCALE_DIR = os.path.join(os.path.dirname(__file__), 'locale')
 TMP_DIR    = os.path.join(os.path.dirname(__file__), 'tmp')
@@ -227,51 +230,150 @@ def debug_show_childset(obj, indent=0, msg=''):
 
 
 
-def get_checksum(array, seed=815, limit=1000000):
+MESH_CACHE = {}
+
+def get_buffer_digest(*buffers):
+    digest = hashlib.blake2b(digest_size=8)
+    for buffer in buffers:
+        digest.update(buffer)
+    return digest.digest()
+
+
+def calc_vertex_digest(vertices):
+    co = array('f', [0.0]) * (3*len(vertices))
+    vertices.foreach_get('co', co)
+    return get_buffer_digest(co)
+
+
+def calc_weight_digest(vertices):
+    groups = array('i')
+    weights = array('f')
+    for v in vertices:
+        vgroups = v.groups
+        groups.append(len(vgroups))
+        for g in vgroups:
+            groups.append(g.group)
+            weights.append(g.weight)
+    return get_buffer_digest(groups, weights)
+
+
+def calc_shapekey_digest(block):
+    co = array('f', [0.0]) * (3*len(block.data))
+    block.data.foreach_get('co', co)
+    return get_buffer_digest(block.name.encode(), co)
+
+
+def get_mesh_cache(me):
+    '''
+    Return the dictionary of data cached for mesh me.
+    It is emptied whenever the mesh geometry changes.
+    '''
+
+    return MESH_CACHE.setdefault(me.as_pointer(), {})
+
+
+def get_weight_stamp(ob):
+    me = ob.data
+    return (len(me.vertices), len(me.loops), len(ob.vertex_groups))
+
+
+def get_weight_digest(ob, use_cache=True):
+    '''
+    Return the digest of the vertex weights of ob.
+    The digest is cached per mesh together with a stamp of the
+    vertex, loop and vertex group counts. Weights written by
+    the current operator do not change that stamp, so callers
+    which may have modified weights must set use_cache=False.
+    '''
+
+    digests = get_mesh_cache(ob.data)
+    stamp = get_weight_stamp(ob)
+    cached = digests.get('weights')
+    if use_cache and cached and cached[0] == stamp:
+        return cached[1]
+
+    digest = calc_weight_digest(ob.data.vertices)
+    digests['weights'] = (stamp, digest)
+    return digest
+
+
+def calc_object_checksum(ob, use_cache=True):
+    '''
+    Return a digest over the vertex locations, the vertex weights
+    and the shape keys of ob. Locations and shape keys are read in
+    bulk on every call. The weight digest is cached, see get_weight_digest()
+    '''
+
+    me = ob.data
+    layers = [
+        calc_vertex_digest(me.vertices),
+        get_weight_digest(ob, use_cache=use_cache)
+    ]
+
+    shape_keys = me.shape_keys
+    if shape_keys and shape_keys.key_blocks:
+        for index, block in enumerate(shape_keys.key_blocks):
+            if index == 0:
+                continue
+            layers.append(calc_shapekey_digest(block))
+
+    return get_buffer_digest(*layers).hex()
+
+
+def get_legacy_checksum(values, seed=815, limit=1000000):
     result = 0
-    for item in array:
+    for item in values:
         result += item
         result *= seed
         result %= limit
     return result
 
 
-def calc_vertex_sum(vertices):
-    cs= fast_get_verts(vertices)
-    sum = get_checksum(cs)
-    return sum
-
-
-def calc_weight_sum(ob):
-
-    return 0
+def calc_legacy_object_checksum(ob):
+    '''
+    The checksum as stored by Avastar versions before the
+    layer digests (a number over locations and shape keys)
+    '''
 
+    me = ob.data
+    sum = get_legacy_checksum(fast_get_verts(me.vertices))
+    shape_keys = me.shape_keys
+    if shape_keys and shape_keys.key_blocks:
+        for index, block in enumerate(shape_keys.key_blocks):
+            if index == 0:
+                continue
+            sum += get_legacy_checksum(fast_get_verts(block.data))
+    return sum
 
-def calc_shapekey_sum(shape_keys):
-    sum = 0
 
-    if not shape_keys:
-        return sum
+def object_checksum_matches(ob, checksum, use_cache=True):
+    '''
+    Compare a stored checksum with the current state of ob.
+    Numeric checksums were stored by older Avastar versions
+    and are compared with the legacy checksum.
+    '''
 
-    key_blocks = shape_keys.key_blocks
-    if not key_blocks:
-        return sum
+    if isinstance(checksum, (int, float)):
+        return checksum == calc_legacy_object_checksum(ob)
+    return checksum == calc_object_checksum(ob, use_cache=use_cache)
 
-    for index, block in enumerate(key_blocks):
-        if index == 0:
-            continue
 
-        co = fast_get_verts(block.data)
-        sum += get_checksum(co)
+def invalidate_mesh_cache(item):
+    '''
+    Forget the cached data of a mesh (or of an object's mesh)
+    '''
 
-    return sum
+    if isinstance(item, bpy.types.Object):
+        item = item.data
+    if isinstance(item, bpy.types.Mesh):
+        MESH_CACHE.pop(item.as_pointer(), None)
+    elif isinstance(item, bpy.types.Key) and item.user:
+        MESH_CACHE.pop(item.user.as_pointer(), None)
 
 
-def calc_object_checksum(ob):
-    sum = calc_vertex_sum(ob.data.vertices)
-    sum += calc_weight_sum(ob)
-    sum += calc_shapekey_sum(ob.data.shape_keys)
-    return sum
+@persistent
+def clear_mesh_cache(dummy):
+    MESH_CACHE.clear()
 
 
 
@@ -1109,12 +1211,17 @@ def material_extensions(obj):
     unassigned_mats = 0
     unassigned_slots = len([1 for slot in obj.material_slots if not slot.material])
 
-    for i, p in enumerate( obj.data.polygons ):
-        index = p.material_index
+    polygons = obj.data.polygons
+    material_indices = array('i', [0]) * len(polygons)
+    loop_totals = array('i', [0]) * len(polygons)
+    polygons.foreach_get('material_index', material_indices)
+    polygons.foreach_get('loop_total', loop_totals)
+
+    for index, loop_total in zip(material_indices, loop_totals):
         data = mat_polycounters.get(index)
         if data:
             data[0] = data[0] + 1
-            data[1] = data[1] + p.loop_total
+            data[1] = data[1] + loop_total
         else:
             unassigned_polys += 1
     extensions = 0
@@ -1877,9 +1984,9 @@ def reset_dirty_mesh(context, obj):
     if object_rev < 20420:
         tag_addon_revision(obj)
 
-def create_mesh_stats(scene, meshobj):
+def create_mesh_stats(scene, meshobj, sync_editmode=True):
 
-    if meshobj.mode == 'EDIT':
+    if sync_editmode and meshobj.mode == 'EDIT':
         meshobj.update_from_editmode()
 
     stats = {}
@@ -1906,16 +2013,21 @@ def create_mesh_stats(scene, meshobj):
     stats[STATS_LOOP_COUNT] = len(me.loops)
     stats[STATS_FACE_COUNT] = len(me.polygons)
     loops    = len(me.loops)
-    flat_face_normals   = [poly.loop_total for poly in me.polygons if not poly.use_smooth]
-    smooth_face_normals = [poly.loop_total for poly in me.polygons if poly.use_smooth]
-    stats[STATS_NORMAL_COUNT] =  max(sum(flat_face_normals),stats[STATS_VERTEX_COUNT])
+
+    polygons = me.polygons
+    use_smooth  = [False] * len(polygons)
+    loop_totals = array('i', [0]) * len(polygons)
+    polygons.foreach_get('use_smooth', use_smooth)
+    polygons.foreach_get('loop_total', loop_totals)
+    flat_face_normals = sum(compress(loop_totals, [not smooth for smooth in use_smooth]))
+    stats[STATS_NORMAL_COUNT] =  max(flat_face_normals,stats[STATS_VERTEX_COUNT])
 
     uv_count = None
     uv_active=me.uv_layers.active
     if uv_active:
         uv_count = get_uv_vert_count(me)
 
-
+    meshobj.to_mesh_clear()
 
     if uv_count is None:
         uv_count = 0
@@ -1948,6 +2060,60 @@ def create_mesh_stats(scene, meshobj):
 
     return stats
 
+MESH_STATS_QUEUE = set()
+
+def get_mesh_stats_stamp(meshobj):
+    arm = meshobj.find_armature()
+    return (
+        arm.name if arm else None,
+        tuple(meshobj.vertex_groups.keys()),
+        tuple(slot.material.name if slot.material else None for slot in meshobj.material_slots),
+        tuple(meshobj.dimensions),
+        tuple(meshobj.scale)
+    )
+
+
+def get_mesh_stats(meshobj):
+    '''
+    Return the cached statistics of meshobj, or None when they
+    are outdated. The cache entry is dropped when the mesh changes.
+    '''
+
+    cached = get_mesh_cache(meshobj.data).get(('mesh_stats', meshobj.name))
+    if cached and cached[0] == get_mesh_stats_stamp(meshobj):
+        return cached[1]
+    return None
+
+
+def request_mesh_stats(meshobj):
+    '''
+    Schedule a statistics refresh for meshobj outside of the draw code
+    '''
+
+    MESH_STATS_QUEUE.add(meshobj.name)
+    if not bpy.app.timers.is_registered(refresh_mesh_stats):
+        bpy.app.timers.register(refresh_mesh_stats, first_interval=0.2)
+
+
+def refresh_mesh_stats():
+    context = bpy.context
+    names = list(MESH_STATS_QUEUE)
+    MESH_STATS_QUEUE.clear()
+    for name in names:
+        meshobj = bpy.data.objects.get(name)
+        if meshobj and meshobj.type == 'MESH':
+            # update_from_editmode() would report a geometry update,
+            # drop the new stats again and queue the next refresh
+            stats = create_mesh_stats(context.scene, meshobj, sync_editmode=False)
+            get_mesh_cache(meshobj.data)[('mesh_stats', meshobj.name)] = (get_mesh_stats_stamp(meshobj), stats)
+
+    for window in context.window_manager.windows:
+        for area in window.screen.areas:
+            if area.type == 'VIEW_3D':
+                area.tag_redraw()
+    return None
+
+
 def get_collapse_icon(state):
     return "TRIA_DOWN" if state else "TRIA_RIGHT"
 
@@ -2138,7 +2304,9 @@ def prepare_modifiers(obj, apply_modifier_stack, apply_armature):
 
 
 def get_uv_vert_count(me):
-    edge_count = len([e.use_seam for e in me.edges if e.use_seam])
+    use_seam = [False] * len(me.edges)
+    me.edges.foreach_get('use_seam', use_seam)
+    edge_count = sum(use_seam)
     return edge_count + len(me.vertices)
     
 
@@ -2194,47 +2362,63 @@ def select_boundary_verts(bmsrc, context, obj, apply_mesh_rotscale = True):
 
 
 def get_adjusted_vertex_normals(context, sources, apply_modifier_stack, apply_mesh_rotscale):
-    bm_source  = bmesh.new()
-    bm_target  = bmesh.new()
-    
-    targets = sources.copy()
-    source_normals    = {}
-    
+    '''
+    Weld the normals of boundary vertices which coincide with
+    boundary vertices of the other sources. Every source is
+    evaluated once and all boundary vertices go into one KDTree.
+    '''
+
+    bm = bmesh.new()
+    boundaries = []
     for obj in sources:
-        try:
-            bm_target.verts.ensure_lookup_table()
-            bm_source.verts.ensure_lookup_table()
-        except:
-            pass
-            
-        target_verts = get_boundary_verts(bm_target, context, obj, apply_modifier_stack, apply_mesh_rotscale)
-        targets.remove(obj)
-        for otherobj in sources:
-            if otherobj == obj:
+        verts = get_boundary_verts(bm, context, obj, apply_modifier_stack, apply_mesh_rotscale)
+        boundaries.append([(v.index, v.co.copy(), v.normal.copy()) for v in verts])
+        bm.clear()
+    bm.free()
+
+    owners = []
+    kd = KDTree(max(1, sum([len(boundary) for boundary in boundaries])))
+    for oi, boundary in enumerate(boundaries):
+        for vi, (index, co, normal) in enumerate(boundary):
+            kd.insert(co, len(owners))
+            owners.append((oi, vi))
+    kd.balance()
+
+    source_normals = {}
+    if len(sources) < 2:
+        return source_normals
+
+    for oi, obj in enumerate(sources):
+        normals = source_normals.setdefault(obj.name, {})
+        fixcounts = {}
+        log.info("Weld %s(%d verts) with %d other meshes" % (obj.name, len(boundaries[oi]), len(sources)-1) )
+
+        for index, co, normal in boundaries[oi]:
+            nearest = {}
+            for hco, hi, hdist in kd.find_range(co, 0.001):
+                ooi, ovi = owners[hi]
+                if ooi == oi:
+                    continue
+                sindex, sco, snormal = boundaries[ooi][ovi]
+                dist = (co - sco).magnitude
+                if dist >= 0.001:
+                    continue
+                best = nearest.get(ooi)
+                if best is None or best[0] > dist or (best[0] == dist and best[1] > ovi):
+                    nearest[ooi] = (dist, ovi, snormal)
+
+            if not nearest:
                 continue
-            source_verts = get_boundary_verts(bm_source, context, otherobj, apply_modifier_stack, apply_mesh_rotscale)
-            if not obj.name in source_normals:
-                source_normals[obj.name]={}
-            normals = source_normals[obj.name]
-            fixcount = 0
-
-            log.info("Weld %s(%d verts) with %s(%d verts)" % (obj.name, len(target_verts), otherobj.name, len(source_verts)) )
-
-            for vert in target_verts:
-                near = get_nearest_vertex_normal(source_verts, vert)
-                if near:
-                    vert.normal = (vert.normal + near) * 0.5
-                    vert.normal.normalize()
-                    normals[vert.index] = vert.normal.copy()
-                    fixcount +=1
-                    
-            if fixcount > 0:
-                print("merged %d normals from %s with target %s" % (fixcount, otherobj.name, obj.name) )
-            bm_source.clear()
-        bm_target.clear()
-        
-    bm_source.free()        
-    bm_target.free()
+
+            for ooi in sorted(nearest):
+                normal = (normal + nearest[ooi][2]) * 0.5
+                normal.normalize()
+                fixcounts[ooi] = fixcounts.get(ooi, 0) + 1
+            normals[index] = normal.copy()
+
+        for ooi, fixcount in sorted(fixcounts.items()):
+            print("merged %d normals from %s with target %s" % (fixcount, sources[ooi].name, obj.name) )
+
     return source_normals
         
 
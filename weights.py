@@ -24,6 +24,7 @@
 
 import bpy, bmesh, sys
 from mathutils import Vector, Matrix
+from mathutils.bvhtree import BVHTree
 import  xml.etree.ElementTree as et
 import xmlrpc.client
 from bpy_extras.io_utils import ExportHelper
@@ -1007,27 +1008,32 @@ def getWeights(target_ob, source_ob, point, submesh = False, restrictTo=None):
 
 
 def interpolation(obj, polygon, loc):
+    verts = obj.data.vertices
+    co = {vidx:verts[vidx].co for vidx in polygon.vertices}
+    return interpolation_weights(co, polygon.vertices, loc)
+
+
+def interpolation_weights(co, polygon_vertices, loc):
 
 
     SMALLEST_DISTANCE = 1e-5
     SMALLEST_WSUM     = 1e-8
 
     D = 0
-    for v1idx in polygon.vertices:
-        v1 = obj.data.vertices[v1idx]
-        for v2idx in polygon.vertices:
-            v2 = obj.data.vertices[v2idx]
+    for v1idx in polygon_vertices:
+        v1 = co[v1idx]
+        for v2idx in polygon_vertices:
+            v2 = co[v2idx]
             if v1idx!=v2idx:
-                d = (v1.co-v2.co).length
+                d = (v1-v2).length
                 D = max(D,d)
     sigma = D
 
     on_vertex = None
     weight_data = {}
     N = 0
-    for vidx in polygon.vertices:
-        v = obj.data.vertices[vidx]
-        d = (loc-v.co).length
+    for vidx in polygon_vertices:
+        d = (loc-co[vidx]).length
 
         if d < SMALLEST_DISTANCE:
             on_vertex = vidx
@@ -1038,7 +1044,7 @@ def interpolation(obj, polygon, loc):
             N += w
 
     if on_vertex is None and N < SMALLEST_WSUM:
-        on_vertex = polygon.vertices[0]
+        on_vertex = polygon_vertices[0]
 
     if on_vertex is None:
         for vidx in weight_data:
@@ -1051,6 +1057,56 @@ def interpolation(obj, polygon, loc):
     return weight_data
 
 
+class WeightTransferSource:
+    '''
+    The geometry and the vertex weights of a weight source,
+    fetched once and indexed in a BVHTree for closest point queries
+    '''
+
+    def __init__(self, source_ob, me, restrictTo=None):
+        self.name = source_ob.name
+        self.Minv = source_ob.matrix_world.inverted()
+        self.co = [v.co.copy() for v in me.vertices]
+        self.polygons = [tuple(p.vertices) for p in me.polygons]
+        self.bvh = BVHTree.FromPolygons(self.co, self.polygons)
+
+        names = [g.name for g in source_ob.vertex_groups]
+        self.weights = []
+        for v in me.vertices:
+            vw = []
+            for grp in v.groups:
+                if grp.group >= len(names):
+                    continue
+                gname = names[grp.group]
+                if  restrictTo==None or gname in restrictTo:
+                    vw.append((gname, grp.weight))
+            self.weights.append(vw)
+
+    def get_weights(self, point, submesh=False):
+        p = self.Minv @ point
+        loc, face_normal, face_index, dist = self.bvh.find_nearest(p)
+        if face_index is None:
+            return float('inf'), {}
+
+        poly = self.polygons[face_index]
+        gdata = {}
+
+        if submesh:
+            dmin = (p-loc).length
+            vw = interpolation_weights(self.co, poly, loc)
+            for vidx, interpw in vw.items():
+                for gname, weight in self.weights[vidx]:
+                    oldweight = gdata.get(gname, 0)
+                    gdata[gname] = oldweight + weight*interpw
+        else:
+            vtx = min(poly, key=lambda v: (p - self.co[v]).length)
+            dmin = (self.co[vtx]-p).length
+            for gname, weight in self.weights[vtx]:
+                gdata[gname] = weight
+
+        return dmin, gdata
+
+
 def copyBoneWeightsToSelectedBones(target, sources, selectedBoneNames, submeshInterpolation=True, allVerts=True, clearTargetWeights=True):
     context = bpy.context
     scene   = context.scene
@@ -1060,78 +1116,45 @@ def copyBoneWeightsToSelectedBones(target, sources, selectedBoneNames, submeshIn
     original_mode = util.ensure_mode_is("WEIGHT_PAINT", object=target)
     if selectedBoneNames == None:
         selectedBoneNames = target.vertex_groups.keys()
-        
-
-
+    selectedBoneNames = set(selectedBoneNames)
 
-
-
-
-    clones = []
-    clean_target_groups = []
+    transfer_sources = []
     print("Copy weights found %d animated mesh objects and %d target bones" % (len(sources), len(selectedBoneNames)) )
     for childobj in sources:
         if not childobj==target and not childobj.name.startswith('CustomShape_'):
 
             print("Found weight source [", childobj.name, "]")
             childmesh = childobj.to_mesh(preserve_all_data_layers=True, depsgraph=depsgraph)
-            childmesh.update(calc_edges=True)
-            childcopyobj = bpy.data.objects.new(childobj.name, childmesh.copy())
-            childcopyobj.matrix_world = childobj.matrix_world.copy()
-            util.link_object(context, childcopyobj)
-            clones.append((childcopyobj, childobj))
+            try:
+                transfer_sources.append(WeightTransferSource(childobj, childmesh, selectedBoneNames))
+            finally:
+                childobj.to_mesh_clear()
 
-    if len(clones) == 0:
+    if len(transfer_sources) == 0:
         raise "Please ensure that at least one part of the Avastar mesh is visible.\n Then try again."
 
-    util.update_view_layer(context)
-
-
-
     M=target.matrix_world
 
     if clearTargetWeights:
         util.remove_weights_from_deform_bones(target, use_all_verts=allVerts)
 
-
-    for vertex in target.data.vertices:
+    verts = target.data.vertices
+    GROUPS = {}
+    for vertex in verts:
         if allVerts or vertex.select:
-            vs = []
             pt = M @ vertex.co
-
-
-            for source in clones:
-
-                d, gdata = getWeights(source[0], source[1], pt, submeshInterpolation, selectedBoneNames)
-                vs.append((d,gdata))
-
-
+            vs = [source.get_weights(pt, submeshInterpolation) for source in transfer_sources]
             vmin = min(vs, key=lambda v: v[0])
 
-            copied=[]
             for gn,w in vmin[1].items():
-                if gn in selectedBoneNames:
-                    copied.append(gn)
-
-
-
-
-                    if gn not in target.vertex_groups:
-                        target.vertex_groups.new(name=gn)
-                        clean_target_groups.append(gn)
-
-                    target.vertex_groups[gn].add([vertex.index], w, 'REPLACE')
-
-
+                GROUPS.setdefault(gn, {}).setdefault(w, []).append(vertex.index)
 
-
-
-
-
-
-
-    for childcopyobj, childobj in clones:
-        util.remove_object(context, childcopyobj)
+    for gn, wmap in GROUPS.items():
+        group = target.vertex_groups.get(gn)
+        if not group:
+            group = target.vertex_groups.new(name=gn)
+        for w, indices in wmap.items():
+            group.add(indices, w, 'REPLACE')
 
     util.ensure_mode_is("OBJECT", object=target)
     util.ensure_mode_is(original_mode, object=target)
@@ -1961,46 +1984,148 @@ def get_closest_point_of_path(obj, p, p0, p1, stepcount=50):
 
     return minloc, mini, close_to_shape_loc, close_to_shape_mini
 
-def smooth_weights(context, obj, bm, from_group, to_group, count=1, factor=0.5, threshold=0.00001, all_verts=True, rendertype='RAW'):
-    arm = obj.find_armature()
-    OM = obj.matrix_world
+def write_group_weights(group, weights):
+    '''
+    Write a dictionary of vertex index -> weight into group
+    with one add() per distinct weight value
+    '''
 
+    values = {}
+    for index, w in weights.items():
+        values.setdefault(w, []).append(index)
+    for w, indices in values.items():
+        group.add(indices, w, 'REPLACE')
 
-    shaped_mesh = util.getMesh(context, obj, rendertype, apply_mesh_rotscale=False, apply_armature=True, msg="S Shape ")
-    shaped_mesh.name = "T_shaped"
-    
-    original_weights = {}
 
+def write_weight_distribution(from_group, to_group, distribution):
+    write_group_weights(from_group, {index:fw for index, (fw, tw) in distribution.items()})
+    write_group_weights(to_group,   {index:tw for index, (fw, tw) in distribution.items()})
+
+
+def get_fitting_weights(mesh, from_group, to_group, threshold, all_verts):
+    '''
+    Return the original (from,to) weights of the affected vertices
+    and their locations in mesh
+    '''
+
+    original_weights = {}
     shape_cos = {}
-    for v in [v for v in shaped_mesh.vertices if all_verts or v.select]:
+    for v in [v for v in mesh.vertices if all_verts or v.select]:
         fw, tw = get_weight_distribution(v, from_group, to_group)
-        original_weights[v.index]=[fw,tw]
         if  fw+tw > threshold:
+            original_weights[v.index]=[fw,tw]
             shape_cos[v.index] = v.co.copy()
-            distribute_weight(v, from_group, to_group, 0, threshold, dbg="1")
+    return original_weights, shape_cos
 
 
-    shape.refresh_shape(context, arm, obj, graceful=True, only_weights=True)
-    start_mesh = util.getMesh(context, obj, rendertype, apply_mesh_rotscale=False, apply_armature=True, msg="S Start ")
-    start_mesh.name="T_start"
-    start_cos = {}
-    for index in shape_cos.keys():
-        v = start_mesh.vertices[index]
-        start_cos[v.index] = v.co.copy()
-        distribute_weight(v, from_group, to_group, 1, threshold, dbg="2")
+def is_linear_in_weights(obj, apply_modifier_stack, apply_armature):
+    '''
+    True when the evaluated vertex locations of obj depend linearly
+    on the vertex weights. That is the case for the shape deltas and
+    for classic (linear blend) armature deformation. Preserve volume
+    armatures and any other active modifier may break it.
+    '''
 
+    if not apply_modifier_stack:
+        return True
 
-    shape.refresh_shape(context, arm, obj, graceful=True, only_weights=True)
-    end_mesh = util.getMesh(context, obj, rendertype, apply_mesh_rotscale=False, apply_armature=True,   msg="S End   ")
+    for m in obj.modifiers:
+        if not m.show_viewport:
+            continue
+        if m.type == 'ARMATURE':
+            if apply_armature and m.use_deform_preserve_volume:
+                return False
+        else:
+            return False
+    return True
+
+
+def get_fitting_cos(context, arm, obj, from_group, to_group, distribution, rendertype, apply_armature, only_weights, msg):
+    '''
+    Return the evaluated locations of the vertices in distribution
+    after their (from,to) weights have been set to distribution
+    '''
+
+    write_weight_distribution(from_group, to_group, distribution)
+    shape.refresh_shape(context, arm, obj, graceful=True, only_weights=only_weights)
+    fitting_mesh = util.getMesh(context, obj, rendertype, apply_mesh_rotscale=False, apply_armature=apply_armature, msg=msg)
+    fitting_mesh.name = "T_fitting"
+
+    vertices = fitting_mesh.vertices
+    cos = {index:vertices[index].co.copy() for index in distribution}
+    bpy.data.meshes.remove(fitting_mesh)
+    return cos
+
+
+def get_fitting_endpoints(context, arm, obj, from_group, to_group, original_weights, shape_cos, rendertype, apply_armature, only_weights, msg):
+    '''
+    Return the fully classic (all weight on to_group) and the fully
+    fitted (all weight on from_group) location of each affected vertex.
+
+    When the deformation is linear in the weight fraction one
+    evaluation where each vertex is moved to the endpoint farther
+    away from its current fraction is enough to extrapolate both
+    endpoints. Otherwise both endpoints are evaluated.
+    '''
+
+    if not is_linear_in_weights(obj, rendertype, apply_armature):
+        log.info("Fitting %s: Deformation is not linear in the weights, evaluate both endpoints" % obj.name)
+        start = {index:(0.0, fw+tw) for index, (fw, tw) in original_weights.items()}
+        end   = {index:(fw+tw, 0.0) for index, (fw, tw) in original_weights.items()}
+        start_cos = get_fitting_cos(context, arm, obj, from_group, to_group, start, rendertype, apply_armature, only_weights, msg)
+        end_cos   = get_fitting_cos(context, arm, obj, from_group, to_group, end, rendertype, apply_armature, only_weights, msg)
+        return start_cos, end_cos
+
+    fractions = {}
+    probe = {}
+    for index, (fw, tw) in original_weights.items():
+        sum = fw + tw
+        fraction = fw/sum
+        probe_fraction = 1.0 if fraction < 0.5 else 0.0
+        fractions[index] = (fraction, probe_fraction)
+        probe[index] = (sum*probe_fraction, sum - sum*probe_fraction)
+
+    probe_cos = get_fitting_cos(context, arm, obj, from_group, to_group, probe, rendertype, apply_armature, only_weights, msg)
+
+    start_cos = {}
     end_cos = {}
-    for index in shape_cos.keys():
-        v = end_mesh.vertices[index]
-        end_cos[v.index] = v.co.copy()
-        fw, tw = original_weights[v.index]
-        set_weight(v, from_group, fw, to_group, tw)
+    for index, (fraction, probe_fraction) in fractions.items():
+        pa = shape_cos[index]
+        pb = probe_cos[index]
+        d  = (pb - pa) / (probe_fraction - fraction)
+        p0 = pa - fraction * d
+        start_cos[index] = p0
+        end_cos[index]   = p0 + d
+
+    return start_cos, end_cos
+
+
+def get_fitted_distribution(index, original_weights, fraction, pgroup):
+    if fraction < 0 or fraction > 1:
+        log.warning("Fitting can not adjust vert %d out of range:(%g)" % (index, fraction))
+        fraction = util.clamp_range(0,fraction,1)
+    fw, tw = original_weights[index]
+    sum = fw + tw
+    fw = sum * fraction
+    tw = sum - fw
+    if pgroup is not None:
+        pgroup[str(index)] = fw
+    return fw, tw
 
 
-    shape.refresh_shape(context, arm, obj, graceful=True, only_weights=True)
+def smooth_weights(context, obj, bm, from_group, to_group, count=1, factor=0.5, threshold=0.00001, all_verts=True, rendertype='RAW'):
+    arm = obj.find_armature()
+    OM = obj.matrix_world
+
+
+    shaped_mesh = util.getMesh(context, obj, rendertype, apply_mesh_rotscale=False, apply_armature=True, msg="S Shape ")
+    shaped_mesh.name = "T_shaped"
+
+    original_weights, shape_cos = get_fitting_weights(shaped_mesh, from_group, to_group, threshold, all_verts)
+    start_cos, end_cos = get_fitting_endpoints(context, arm, obj, from_group, to_group,
+                             original_weights, shape_cos, rendertype,
+                             apply_armature=True, only_weights=True, msg="S Probe ")
+
     bm.from_mesh(shaped_mesh)
     verts = [v for v in bm.verts if all_verts or v.select]
 
@@ -2010,13 +2135,13 @@ def smooth_weights(context, obj, bm, from_group, to_group, count=1, factor=0.5,
 
     util.update_view_layer(bpy.context)
     unsolved_verts = []
+    distribution = dict(original_weights)
     pgroup = get_pgroup(obj, to_group.name, create=True)
     for index, co in shape_cos.items():
-        v  = start_mesh.vertices[index]
 
         p  = Vector(target_cos[index]) # wanted location
-        p0 = Vector(start_cos[index]) # fully classic
-        p1 = Vector(end_cos[index]) # fully fitted
+        p0 = start_cos[index] # fully classic
+        p1 = end_cos[index] # fully fitted
         l  = (p1-p0).magnitude
 
         if l > 0.001:
@@ -2025,14 +2150,12 @@ def smooth_weights(context, obj, bm, from_group, to_group, count=1, factor=0.5,
 
 
             fraction = util.clamp_range(0,fraction,1)
-            fw, tw = distribute_weight(v, from_group, to_group, fraction, threshold, pgroup=pgroup, dbg="3")
+            distribution[index] = get_fitted_distribution(index, original_weights, fraction, pgroup)
         else:
             unsolved_verts.append(index)
 
-
+    write_weight_distribution(from_group, to_group, distribution)
     shape.refresh_shape(context, arm, obj, graceful=True, only_weights=True)
-    bpy.data.meshes.remove(start_mesh)
-    bpy.data.meshes.remove(end_mesh)
     bpy.data.meshes.remove(shaped_mesh)
 
     return unsolved_verts
@@ -2041,80 +2164,24 @@ def smooth_weights(context, obj, bm, from_group, to_group, count=1, factor=0.5,
 def distribute_weights(context, obj, from_group, to_group, threshold=0.00001, all_verts=True, rendertype='RAW'):
     arm = obj.find_armature()
 
-
-
-
-
     shaped_mesh = util.getMesh(context, obj, rendertype, apply_mesh_rotscale=False, msg="D Shape ")
     shaped_mesh.name = "T_shaped"
 
+    original_weights, shape_cos = get_fitting_weights(shaped_mesh, from_group, to_group, threshold, all_verts)
+    start_cos, end_cos = get_fitting_endpoints(context, arm, obj, from_group, to_group,
+                             original_weights, shape_cos, rendertype,
+                             apply_armature=False, only_weights=False, msg="D Probe ")
 
-
-    
-
-
-
-    shape_cos = {}
-    original_weights = {}
-    for v in [v for v in shaped_mesh.vertices if all_verts or v.select]:
-        fw, tw = get_weight_distribution(v, from_group, to_group)
-        original_weights[v.index]=[fw,tw]
-
-
-
-        if  fw+tw > threshold:
-            shape_cos[v.index] = v.co.copy()
-            distribute_weight(v, from_group, to_group, 0, threshold, dbg="1")
-
-
-
-
-    shape.refresh_shape(context, arm, obj, graceful=True)
-
-    start_mesh = util.getMesh(context, obj, rendertype, apply_mesh_rotscale=False, msg="D Start ")
-    start_mesh.name="T_start"
-    start_cos = {}
-    for index in shape_cos.keys():
-        v = start_mesh.vertices[index]
-        start_cos[v.index] = v.co.copy()
-
-        distribute_weight(v, from_group, to_group, 1, threshold, dbg="2")
-
-
-
-
-    shape.refresh_shape(context, arm, obj, graceful=True)
-
-    end_mesh = util.getMesh(context, obj, rendertype, apply_mesh_rotscale=False, msg="D End   ")
-    end_mesh.name="T_end"
-    end_cos = {}
-    for index in shape_cos.keys():
-        v = end_mesh.vertices[index]
-        end_cos[v.index] = v.co.copy()
-        fw, tw = original_weights[v.index]
-        set_weight(v, from_group, fw, to_group, tw)
-
-
-
-
-
-
-
-
-
-
-
-    
+    write_weight_distribution(from_group, to_group, original_weights)
     shape.refresh_shape(context, arm, obj, graceful=True)
 
     unsolved_verts = []
+    distribution = dict(original_weights)
     pgroup = get_pgroup(obj, to_group.name, create=True)
 
     for index, co in shape_cos.items():
-        v = start_mesh.vertices[index]
-        p  = Vector(shape_cos[index])
-        p0 = Vector(start_cos[index])
-        p1 = Vector(end_cos[index])
+        p0 = start_cos[index]
+        p1 = end_cos[index]
 
 
 
@@ -2132,11 +2199,7 @@ def distribute_weights(context, obj, from_group, to_group, threshold=0.00001, al
             if i > -1:
                 f = (loc-p0).magnitude
                 fraction = f/l
-                fw, tw = distribute_weight(v, from_group, to_group, fraction, threshold, pgroup=pgroup, dbg="3")
-
-
-
-
+                distribution[index] = get_fitted_distribution(index, original_weights, fraction, pgroup)
             else:
                 print("no solution for vertex %d not fitted l:%f" % (index, l))
 
@@ -2144,23 +2207,9 @@ def distribute_weights(context, obj, from_group, to_group, threshold=0.00001, al
             unsolved_verts.append(index)
             print("vertex %d not fitted" % index)
 
-
-
-
-
-
-
-
-
-
-
-
-
-
-
+    write_weight_distribution(from_group, to_group, distribution)
     shape.refresh_shape(context, arm, obj, graceful=True)
-
-
+    bpy.data.meshes.remove(shaped_mesh)
 
     return unsolved_verts
 